@@ -5,12 +5,20 @@ Remove old jobs, check disk usage, and manage storage
 
 import argparse
 import json
+import os
 import shutil
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from datetime import datetime
+from typing import Dict, List, Optional
 import sys
 import logging
 
+try:
+    import orjson
+except ImportError:  # orjson is optional; fall back to stdlib json
+    orjson = None
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -18,22 +26,74 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Size calculation is stat()-bound, so threads overlap the I/O latency.
+# Raise CLEANUP_SIZE_WORKERS on high-latency storage (NFS, FUSE) to keep
+# more stat() calls in flight at once.
+SIZE_WORKERS = max(1, int(os.getenv('CLEANUP_SIZE_WORKERS', '16')))
+
 
 def get_jobs_dir():
     """Get the jobs directory path"""
     return Path('/workspace/jobs')
 
 
+def _iter_job_dirs(jobs_dir):
+    """Yield a DirEntry for each job directory (uses d_type, no extra stat)"""
+    with os.scandir(jobs_dir) as it:
+        for entry in it:
+            if entry.is_dir(follow_symlinks=False):
+                yield entry
+
+
+def _scan_size(path) -> int:
+    """Recursively sum file sizes using cached DirEntry stat results"""
+    total = 0
+    with os.scandir(path) as it:
+        for entry in it:
+            if entry.is_file(follow_symlinks=False):
+                total += entry.stat(follow_symlinks=False).st_size
+            elif entry.is_dir(follow_symlinks=False):
+                total += _scan_size(entry.path)
+    return total
+
+
 def get_directory_size(path: Path) -> int:
     """Calculate total size of directory in bytes"""
-    total = 0
     try:
-        for item in path.rglob('*'):
-            if item.is_file():
-                total += item.stat().st_size
+        return _scan_size(path)
     except Exception as e:
         logger.error(f"Error calculating size: {e}")
-    return total
+        return 0
+
+
+def get_job_sizes(jobs_dir: Path, job_ids: List[str]) -> Dict[str, int]:
+    """
+    Calculate the size of each given job directory in parallel
+
+    Returns:
+        Dict mapping job_id -> size in bytes
+    """
+    with ThreadPoolExecutor(max_workers=SIZE_WORKERS) as pool:
+        sizes = pool.map(get_directory_size, [jobs_dir / job_id for job_id in job_ids])
+    return dict(zip(job_ids, sizes))
+
+
+def get_mounted_usage(jobs_dir: Path) -> Optional[int]:
+    """
+    Return the filesystem's used bytes (statvfs) when jobs_dir is its own mount point
+
+    This is filesystem-wide usage (including metadata, reserved blocks and any
+    non-job files on the volume), not the size of the jobs.
+
+    Returns:
+        Used bytes, or None if jobs_dir shares a filesystem with its parent
+    """
+    try:
+        if os.stat(jobs_dir).st_dev == os.stat(jobs_dir.parent).st_dev:
+            return None
+        return shutil.disk_usage(jobs_dir).used
+    except OSError:
+        return None
 
 
 def format_size(bytes_size: int) -> str:
@@ -45,7 +105,54 @@ def format_size(bytes_size: int) -> str:
     return f"{bytes_size:.2f} TB"
 
 
-def list_jobs():
+def _read_metadata(path) -> dict:
+    """Read and parse a metadata.json file (orjson when available)"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def _load_all_metadata(jobs_dir: Path) -> Dict[str, dict]:
+    """
+    Read every job's metadata.json exactly once
+
+    Returns:
+        Dict mapping job_id -> parsed metadata (jobs without metadata are skipped)
+    """
+    metadata_by_job = {}
+    for entry in _iter_job_dirs(jobs_dir):
+        metadata_file = os.path.join(entry.path, 'metadata.json')
+        if not os.path.exists(metadata_file):
+            continue
+        try:
+            metadata_by_job[entry.name] = _read_metadata(metadata_file)
+        except Exception as e:
+            print(f"Error reading job {entry.name}: {e}")
+    return metadata_by_job
+
+
+def _delete_jobs(jobs_dir: Path, metadata_by_job: Dict[str, dict], job_ids: List[str]) -> List[dict]:
+    """Delete the given jobs from disk and drop them from the metadata cache"""
+    deleted = []
+    for job_id in job_ids:
+        job_dir = jobs_dir / job_id
+        try:
+            size = get_directory_size(job_dir)
+            shutil.rmtree(job_dir)
+            metadata_by_job.pop(job_id, None)
+            deleted.append({
+                'job_id': job_id,
+                'size': size
+            })
+            print(f"Deleted job {job_id} ({format_size(size)})")
+        except Exception as e:
+            print(f"Error processing job {job_id}: {e}")
+    return deleted
+
+
+def list_jobs(metadata_by_job: Optional[Dict[str, dict]] = None):
     """List all jobs with their details"""
     jobs_dir = get_jobs_dir()
 
@@ -53,45 +160,37 @@ def list_jobs():
         print("No jobs directory found")
         return
 
-    jobs = []
-    for job_dir in jobs_dir.iterdir():
-        if job_dir.is_dir():
-            metadata_file = job_dir / 'metadata.json'
-            if metadata_file.exists():
-                try:
-                    with open(metadata_file, 'r') as f:
-                        metadata = json.load(f)
-
-                    size = get_directory_size(job_dir)
-                    created = datetime.fromtimestamp(metadata.get('created_at', 0))
-
-                    jobs.append({
-                        'job_id': job_dir.name,
-                        'status': metadata.get('status', 'unknown'),
-                        'created': created,
-                        'size': size,
-                        'config': metadata.get('config', {})
-                    })
-                except Exception as e:
-                    print(f"Error reading job {job_dir.name}: {e}")
-
-    # Sort by creation time (newest first)
-    jobs.sort(key=lambda x: x['created'], reverse=True)
+    if metadata_by_job is None:
+        metadata_by_job = _load_all_metadata(jobs_dir)
+
+    # Sort by creation time (newest first) using metadata alone, before any size walk
+    job_ids = sorted(
+        metadata_by_job,
+        key=lambda job_id: metadata_by_job[job_id].get('created_at', 0),
+        reverse=True
+    )
 
     # Display
-    print(f"\nTotal jobs: {len(jobs)}")
+    print(f"\nTotal jobs: {len(job_ids)}")
     print("-" * 80)
 
-    for job in jobs:
-        print(f"Job ID: {job['job_id']}")
-        print(f"  Status: {job['status']}")
-        print(f"  Created: {job['created'].strftime('%Y-%m-%d %H:%M:%S')}")
-        print(f"  Size: {format_size(job['size'])}")
-        print(f"  Prompt: {job['config'].get('prompt', 'N/A')[:60]}...")
-        print()
+    # executor.map yields in submission order, so rows stream out as sizes complete
+    with ThreadPoolExecutor(max_workers=SIZE_WORKERS) as pool:
+        sizes = pool.map(get_directory_size, [jobs_dir / job_id for job_id in job_ids])
+        for job_id, size in zip(job_ids, sizes):
+            metadata = metadata_by_job[job_id]
+            created = datetime.fromtimestamp(metadata.get('created_at', 0))
+            config = metadata.get('config', {})
+
+            print(f"Job ID: {job_id}")
+            print(f"  Status: {metadata.get('status', 'unknown')}")
+            print(f"  Created: {created.strftime('%Y-%m-%d %H:%M:%S')}")
+            print(f"  Size: {format_size(size)}")
+            print(f"  Prompt: {config.get('prompt', 'N/A')[:60]}...")
+            print()
 
 
-def cleanup_by_age(hours: float):
+def cleanup_by_age(hours: float, metadata_by_job: Optional[Dict[str, dict]] = None):
     """Remove jobs older than specified hours"""
     jobs_dir = get_jobs_dir()
 
@@ -99,30 +198,17 @@ def cleanup_by_age(hours: float):
         print("No jobs directory found")
         return
 
+    if metadata_by_job is None:
+        metadata_by_job = _load_all_metadata(jobs_dir)
+
     import time
     cutoff_time = time.time() - (hours * 3600)
-    deleted = []
 
-    for job_dir in jobs_dir.iterdir():
-        if job_dir.is_dir():
-            metadata_file = job_dir / 'metadata.json'
-            if metadata_file.exists():
-                try:
-                    with open(metadata_file, 'r') as f:
-                        metadata = json.load(f)
-
-                    created_at = metadata.get('created_at', 0)
-                    if created_at < cutoff_time:
-                        size = get_directory_size(job_dir)
-                        shutil.rmtree(job_dir)
-                        deleted.append({
-                            'job_id': job_dir.name,
-                            'size': size
-                        })
-                        print(f"Deleted job {job_dir.name} ({format_size(size)})")
-
-                except Exception as e:
-                    print(f"Error processing job {job_dir.name}: {e}")
+    expired = [
+        job_id for job_id, metadata in metadata_by_job.items()
+        if metadata.get('created_at', 0) < cutoff_time
+    ]
+    deleted = _delete_jobs(jobs_dir, metadata_by_job, expired)
 
     if deleted:
         total_size = sum(j['size'] for j in deleted)
@@ -131,7 +217,7 @@ def cleanup_by_age(hours: float):
         print(f"No jobs older than {hours} hours found")
 
 
-def cleanup_by_status(status: str):
+def cleanup_by_status(status: str, metadata_by_job: Optional[Dict[str, dict]] = None):
     """Remove jobs with specific status"""
     jobs_dir = get_jobs_dir()
 
@@ -139,27 +225,14 @@ def cleanup_by_status(status: str):
         print("No jobs directory found")
         return
 
-    deleted = []
+    if metadata_by_job is None:
+        metadata_by_job = _load_all_metadata(jobs_dir)
 
-    for job_dir in jobs_dir.iterdir():
-        if job_dir.is_dir():
-            metadata_file = job_dir / 'metadata.json'
-            if metadata_file.exists():
-                try:
-                    with open(metadata_file, 'r') as f:
-                        metadata = json.load(f)
-
-                    if metadata.get('status') == status:
-                        size = get_directory_size(job_dir)
-                        shutil.rmtree(job_dir)
-                        deleted.append({
-                            'job_id': job_dir.name,
-                            'size': size
-                        })
-                        print(f"Deleted job {job_dir.name} ({format_size(size)})")
-
-                except Exception as e:
-                    print(f"Error processing job {job_dir.name}: {e}")
+    matching = [
+        job_id for job_id, metadata in metadata_by_job.items()
+        if metadata.get('status') == status
+    ]
+    deleted = _delete_jobs(jobs_dir, metadata_by_job, matching)
 
     if deleted:
         total_size = sum(j['size'] for j in deleted)
@@ -168,7 +241,7 @@ def cleanup_by_status(status: str):
         print(f"No jobs with status '{status}' found")
 
 
-def cleanup_specific_job(job_id: str):
+def cleanup_specific_job(job_id: str, metadata_by_job: Optional[Dict[str, dict]] = None):
     """Remove a specific job"""
     jobs_dir = get_jobs_dir()
     job_dir = jobs_dir / job_id
@@ -179,10 +252,12 @@ def cleanup_specific_job(job_id: str):
 
     size = get_directory_size(job_dir)
     shutil.rmtree(job_dir)
+    if metadata_by_job is not None:
+        metadata_by_job.pop(job_id, None)
     print(f"Deleted job {job_id} ({format_size(size)})")
 
 
-def show_disk_status():
+def show_disk_status(metadata_by_job: Optional[Dict[str, dict]] = None):
     """Show disk usage statistics"""
     jobs_dir = get_jobs_dir()
 
@@ -190,31 +265,30 @@ def show_disk_status():
         print("No jobs directory found")
         return
 
-    total_size = get_directory_size(jobs_dir)
+    if metadata_by_job is None:
+        metadata_by_job = _load_all_metadata(jobs_dir)
+
+    job_sizes = get_job_sizes(jobs_dir, list(metadata_by_job.keys()))
 
     # Count by status
     status_counts = {}
     status_sizes = {}
 
-    for job_dir in jobs_dir.iterdir():
-        if job_dir.is_dir():
-            metadata_file = job_dir / 'metadata.json'
-            if metadata_file.exists():
-                try:
-                    with open(metadata_file, 'r') as f:
-                        metadata = json.load(f)
+    for job_id, metadata in metadata_by_job.items():
+        status = metadata.get('status', 'unknown')
+        size = job_sizes.get(job_id, 0)
 
-                    status = metadata.get('status', 'unknown')
-                    size = get_directory_size(job_dir)
+        status_counts[status] = status_counts.get(status, 0) + 1
+        status_sizes[status] = status_sizes.get(status, 0) + size
 
-                    status_counts[status] = status_counts.get(status, 0) + 1
-                    status_sizes[status] = status_sizes.get(status, 0) + size
-
-                except Exception as e:
-                    print(f"Error reading job {job_dir.name}: {e}")
+    # Derive the headline from the per-job sizes instead of walking again
+    total_size = sum(status_sizes.values())
+    filesystem_used = get_mounted_usage(jobs_dir)
 
     print("\n=== Disk Usage Status ===")
     print(f"Total jobs size: {format_size(total_size)}")
+    if filesystem_used is not None:
+        print(f"Filesystem used (jobs volume): {format_size(filesystem_used)}")
     print("\nBy status:")
     for status in sorted(status_counts.keys()):
         print(f"  {status}: {status_counts[status]} jobs, {format_size(status_sizes[status])}")
@@ -229,7 +303,7 @@ def cleanup_all():
         return
 
     # Count jobs
-    job_count = len([d for d in jobs_dir.iterdir() if d.is_dir()])
+    job_count = sum(1 for _ in _iter_job_dirs(jobs_dir))
 
     if job_count == 0:
         print("No jobs to clean up")
@@ -243,10 +317,18 @@ def cleanup_all():
         print("Cancelled")
         return
 
-    # Delete all
+    # Delete all. Remove the directory's contents rather than the directory
+    # itself: jobs_dir may be a mount point, which can't be removed (EBUSY)
     total_size = get_directory_size(jobs_dir)
-    shutil.rmtree(jobs_dir)
-    jobs_dir.mkdir(parents=True, exist_ok=True)
+    with os.scandir(jobs_dir) as it:
+        for entry in it:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    shutil.rmtree(entry.path)
+                else:
+                    os.unlink(entry.path)
+            except Exception as e:
+                print(f"Error removing {entry.name}: {e}")
 
     print(f"Deleted all {job_count} jobs, freed {format_size(total_size)}")
 
@@ -268,20 +350,24 @@ def main():
         parser.print_help()
         return
 
+    # Parse each job's metadata once and share it across subcommands
+    jobs_dir = get_jobs_dir()
+    metadata_by_job = _load_all_metadata(jobs_dir) if jobs_dir.exists() else {}
+
     if args.list:
-        list_jobs()
+        list_jobs(metadata_by_job)
 
     if args.status:
-        show_disk_status()
+        show_disk_status(metadata_by_job)
 
     if args.hours:
-        cleanup_by_age(args.hours)
+        cleanup_by_age(args.hours, metadata_by_job)
 
     if args.job:
-        cleanup_specific_job(args.job)
+        cleanup_specific_job(args.job, metadata_by_job)
 
     if args.by_status:
-        cleanup_by_status(args.by_status)
+        cleanup_by_status(args.by_status, metadata_by_job)
 
     if args.all:
         cleanup_all()
@@ -3,35 +3,254 @@ Image Editor using Qwen-Image-Edit-2509-GGUF model
 Handles loading, inference, and image combining
 """
 
+import gc
+import os
+import math
+import time
 import torch
-from PIL import Image
+import threading
+import hashlib
+import weakref
+import numpy as np
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image, ImageOps
+from contextlib import nullcontext
 from typing import List, Callable, Optional
 import logging
 
 logger = logging.getLogger(__name__)
 
+# TF32 matmuls for any fp32 ops, and cuDNN autotuning for the VAE convolutions
+# (tuned once per input shape, then cached for the process)
+torch.backends.cuda.matmul.allow_tf32 = True
+torch.backends.cudnn.allow_tf32 = True
+torch.backends.cudnn.benchmark = True
+
+# Max cached (prompt, image) text-encoder results kept on device
+PROMPT_CACHE_SIZE = 8
+
+# Unused allocator cache (bytes) above which empty_cache() runs after a job
+EMPTY_CACHE_THRESHOLD = 2 * 1024**3
+
+# Allocator memory mapped up front after a CUDA model load (MB; 0 disables).
+# Roughly the activation peak of a ~1MP edit; kept below EMPTY_CACHE_THRESHOLD
+# so the warmed segment stays cached between jobs
+ALLOCATOR_WARMUP_MB = max(0, int(os.getenv('ALLOCATOR_WARMUP_MB', '1024')))
+
+# Loaded editors kept per process, keyed by their full configuration (ImageEditor._cache_key)
+PIPELINE_CACHE_SIZE = max(1, int(os.getenv('PIPELINE_CACHE_SIZE', '1')))
+_PIPELINE_CACHE: "OrderedDict[tuple, ImageEditor]" = OrderedDict()
+_PIPELINE_CACHE_LOCK = threading.Lock()
+# Keys being loaded right now; other callers for the same key wait on the event
+_PIPELINE_LOADING: "dict[tuple, threading.Event]" = {}
+
+# Inputs are downscaled so their longest side is at most this before inference;
+# the pipeline resizes to ~1MP internally, so larger inputs only add preprocessing cost
+MAX_INPUT_SIDE = 2048
+
+# Nominal storage cost of each GGUF level's main block type (bits per weight)
+GGUF_BITS_PER_WEIGHT = {
+    "Q2_K": 2.625,
+    "Q4_K_M": 4.5,
+    "Q5_K_S": 5.5,
+    "Q6_K": 6.5625,
+    "Q8_0": 8.5,
+}
+
+# Output encoding runs here so it overlaps post-inference GPU cleanup
+_SAVE_POOL = ThreadPoolExecutor(max_workers=2, thread_name_prefix="image-save")
+
+
+def _release_gpu(full_gc: bool = False, threshold: int = 0) -> None:
+    """
+    Return unused cached allocator blocks to the GPU
+
+    Args:
+        full_gc: Run gc.collect() first. Only needed on error/retry/eviction paths,
+            where tracebacks and reference cycles can keep tensors alive; on the
+            happy path dropping references frees tensors immediately.
+        threshold: Only empty the cache when it holds more unused bytes than this
+    """
+    if full_gc:
+        gc.collect()
+    if torch.cuda.is_available():
+        if torch.cuda.memory_reserved() - torch.cuda.memory_allocated() > threshold:
+            torch.cuda.empty_cache()
+    elif torch.backends.mps.is_available():
+        if torch.mps.driver_allocated_memory() - torch.mps.current_allocated_memory() > threshold:
+            torch.mps.empty_cache()
+
 
 class ImageEditor:
     """
     Wrapper for Qwen-Image-Edit-2509-GGUF pipeline
-    Supports single image editing and multi-image combining
+    Supports single image editing and multi-image editing (native multi-image
+    input on the 2509 pipeline, side-by-side combining otherwise)
     """
 
-    def __init__(self, progress_callback: Optional[Callable[[int], None]] = None, use_gguf: bool = True, quantization_level: str = "Q5_K_S"):
+    def __init__(
+        self,
+        progress_callback: Optional[Callable[[int], None]] = None,
+        use_gguf: bool = True,
+        quantization_level: str = "Q4_K_M",
+        compile_transformer: Optional[bool] = None,
+        weight_quantization: Optional[str] = None
+    ):
         """
         Initialize and load the Qwen-Image-Edit-2509-GGUF model
 
         Args:
             progress_callback: Optional callback for download progress (receives percentage 0-100)
             use_gguf: Whether to use GGUF quantized model (faster, less VRAM)
-            quantization_level: GGUF quantization level (Q2_K, Q4_K_M, Q5_K_S, Q8_0)
+            quantization_level: GGUF quantization level (Q2_K, Q4_K_M, Q5_K_S, Q6_K, Q8_0)
+            compile_transformer: Compile the transformer with torch.compile (compiled
+                graph is reused by every edit_image call on this instance).
+                None compiles on CUDA only; MPS support in torch.compile is incomplete
+            weight_quantization: Optional torchao weight quantization for the standard
+                (non-GGUF) transformer: "int8" or "fp8" (fp8 needs Ada/Hopper GPUs)
         """
         self.pipeline = None
         self.use_gguf = use_gguf
         self.quantization_level = quantization_level
+        self.compile_transformer = compile_transformer
+        self.weight_quantization = weight_quantization
+        self.compiled = False
+        self._compile_verified = False
+        self.offload = None
+        self.attention_backend = "sdpa"
+        self.multi_image = False
         self.device, self.dtype = self._get_device_and_dtype()
+        self._check_jpeg_encoder()
         self._load_model(progress_callback)
 
+    @classmethod
+    def get_or_create(
+        cls,
+        progress_callback: Optional[Callable[[int], None]] = None,
+        use_gguf: bool = True,
+        quantization_level: str = "Q4_K_M",
+        compile_transformer: Optional[bool] = None,
+        weight_quantization: Optional[str] = None
+    ) -> "ImageEditor":
+        """
+        Return the process-wide editor for this model, loading it only on a miss
+
+        Loaded editors are cached by their full configuration (see _cache_key),
+        so GGUF dequantization and the from_pretrained disk scan happen once per
+        process. Least recently used editors beyond PIPELINE_CACHE_SIZE are
+        dropped so switching quantization levels does not keep both resident.
+
+        Args:
+            progress_callback: Optional callback for download progress (only used on a miss)
+            use_gguf: Whether to use GGUF quantized model
+            quantization_level: GGUF quantization level
+            compile_transformer: See ImageEditor.__init__
+            weight_quantization: See ImageEditor.__init__
+
+        Returns:
+            Loaded ImageEditor instance
+        """
+        key = cls._cache_key(use_gguf, quantization_level, compile_transformer, weight_quantization)
+
+        # The lock only guards the cache bookkeeping; the load itself runs
+        # unlocked so is_cached() and hits on other keys never wait for it
+        while True:
+            with _PIPELINE_CACHE_LOCK:
+                editor = _PIPELINE_CACHE.get(key)
+                if editor is not None:
+                    _PIPELINE_CACHE.move_to_end(key)
+                    return editor
+
+                loading = _PIPELINE_LOADING.get(key)
+                if loading is None:
+                    loading = _PIPELINE_LOADING[key] = threading.Event()
+
+                    # Release evicted models before loading so peak memory holds one copy
+                    # (the evicted editor is not bound to any name, so it can be freed)
+                    while _PIPELINE_CACHE and len(_PIPELINE_CACHE) + len(_PIPELINE_LOADING) > PIPELINE_CACHE_SIZE:
+                        evicted_key = _PIPELINE_CACHE.popitem(last=False)[0]
+                        logger.info(f"Evicting cached pipeline {evicted_key}")
+                    break
+
+            # Another thread is loading this model; re-check once it's done
+            loading.wait()
+
+        try:
+            _release_gpu(full_gc=True)
+            editor = cls(
+                progress_callback=progress_callback,
+                use_gguf=use_gguf,
+                quantization_level=quantization_level,
+                compile_transformer=compile_transformer,
+                weight_quantization=weight_quantization
+            )
+            with _PIPELINE_CACHE_LOCK:
+                _PIPELINE_CACHE[key] = editor
+            return editor
+        finally:
+            with _PIPELINE_CACHE_LOCK:
+                del _PIPELINE_LOADING[key]
+            loading.set()
+
+    @classmethod
+    def is_cached(
+        cls,
+        use_gguf: bool = True,
+        quantization_level: str = "Q4_K_M",
+        compile_transformer: Optional[bool] = None,
+        weight_quantization: Optional[str] = None
+    ) -> bool:
+        """Whether get_or_create would return an already-loaded editor"""
+        key = cls._cache_key(use_gguf, quantization_level, compile_transformer, weight_quantization)
+        with _PIPELINE_CACHE_LOCK:
+            return key in _PIPELINE_CACHE
+
+    @staticmethod
+    def _check_jpeg_encoder():
+        """Warn if Pillow was not built against libjpeg-turbo (slow JPEG encode/decode)"""
+        try:
+            from PIL import features
+            if not features.check_feature('libjpeg_turbo'):
+                logger.warning("Pillow is not using libjpeg-turbo; JPEG encode/decode will be slower")
+        except Exception:
+            pass
+
+    @classmethod
+    def _cache_key(
+        cls,
+        use_gguf: bool,
+        quantization_level: str,
+        compile_transformer: Optional[bool],
+        weight_quantization: Optional[str]
+    ) -> tuple:
+        """
+        Pipeline cache key, normalized so equivalent configurations share an editor
+
+        Settings that don't apply are dropped (quantization_level without GGUF,
+        weight_quantization with GGUF), and compile_transformer=None is resolved
+        to its per-device default.
+        """
+        device = cls._device_name()
+        if compile_transformer is None:
+            compile_transformer = device == "cuda"
+        return (
+            use_gguf,
+            quantization_level if use_gguf else None,
+            None if use_gguf else weight_quantization,
+            bool(compile_transformer),
+            device
+        )
+
+    @staticmethod
+    def _device_name() -> str:
+        """Best available device name: MPS (Apple Silicon) > CUDA (NVIDIA) > CPU"""
+        if torch.backends.mps.is_available():
+            return "mps"
+        if torch.cuda.is_available():
+            return "cuda"
+        return "cpu"
+
     def _get_device_and_dtype(self):
         """
         Get the optimal device and dtype for the current system.
@@ -40,10 +259,11 @@ class ImageEditor:
         Returns:
             Tuple of (device, dtype)
         """
-        if torch.backends.mps.is_available():
+        device = self._device_name()
+        if device == "mps":
             logger.info("Using MPS (Apple Silicon GPU)")
             return "mps", torch.bfloat16
-        elif torch.cuda.is_available():
+        elif device == "cuda":
             logger.info("Using CUDA (NVIDIA GPU)")
             return "cuda", torch.bfloat16
         else:
@@ -63,6 +283,280 @@ class ImageEditor:
             # Fallback to standard model (kept for compatibility)
             self._load_standard_model(progress_callback)
 
+        self._install_prompt_cache()
+        self._enable_vae_tiling()
+
+        if self.device == "cuda":
+            self._use_channels_last_vae()
+            self._configure_attention()
+
+        compile_transformer = self.compile_transformer
+        if compile_transformer is None:
+            compile_transformer = self.device == "cuda"
+        if compile_transformer:
+            self._compile_transformer()
+
+        if self.device == "cuda":
+            self.warmup_allocator()
+
+    def warmup_allocator(self, size_mb: int = ALLOCATOR_WARMUP_MB):
+        """
+        Map allocator memory before the first inference
+
+        With expandable_segments, CUDA memory is reserved and mapped lazily, so
+        the first job pays for growing the segment on top of everything else.
+        Allocating and freeing one block here does that work at load time; the
+        block stays in the caching allocator for inference to reuse.
+
+        Args:
+            size_mb: Block size in MB (capped at half the free device memory)
+        """
+        if size_mb <= 0 or not torch.cuda.is_available():
+            return
+
+        try:
+            free_bytes, _ = torch.cuda.mem_get_info()
+            size = min(size_mb * 1024**2, free_bytes // 2)
+            block = torch.empty(size, dtype=torch.uint8, device="cuda")
+            del block
+            torch.cuda.synchronize()
+            logger.info(f"Allocator warmed up with {size // 1024**2}MB")
+        except Exception as e:
+            logger.warning(f"Allocator warm-up skipped: {str(e)}")
+
+    def _enable_group_offload(self) -> bool:
+        """
+        Offload pipeline weights to pinned CPU memory with prefetching on a side stream
+
+        Unlike enable_model_cpu_offload, which moves whole components
+        synchronously when they are first called, each layer's weights are
+        copied to the GPU on a separate CUDA stream while the previous layer
+        computes, so transfers overlap compute at a similar VRAM footprint.
+
+        Returns:
+            True if group offloading was applied to every component
+        """
+        try:
+            from diffusers.hooks import apply_group_offloading
+        except ImportError:
+            return False
+
+        onload_device = torch.device("cuda")
+        offload_device = torch.device("cpu")
+        try:
+            for name in ("transformer", "text_encoder", "vae"):
+                module = getattr(self.pipeline, name, None)
+                if module is not None:
+                    apply_group_offloading(
+                        module,
+                        onload_device=onload_device,
+                        offload_device=offload_device,
+                        offload_type="leaf_level",
+                        use_stream=True
+                    )
+            return True
+        except Exception as e:
+            logger.warning(f"Group offloading unavailable, using model CPU offload: {str(e)}")
+            return False
+
+    def _enable_vae_tiling(self):
+        """
+        Decode latents in overlapping tiles (and batches one sample at a time)
+
+        The VAE decode at the end of inference is the peak-memory step and grows
+        with H*W; tiling bounds it so large edits fit alongside the offloaded
+        transformer on 8-16GB devices, at a small speed cost.
+        """
+        try:
+            self.pipeline.vae.enable_tiling()
+            self.pipeline.vae.enable_slicing()
+            logger.info("Enabled VAE tiling and slicing")
+        except Exception as e:
+            logger.warning(f"Could not enable VAE tiling: {str(e)}")
+
+    def _use_channels_last_vae(self):
+        """
+        Store VAE conv weights channels-last for faster cuDNN convolutions
+
+        The Qwen VAE is built from causal 3D convolutions, so the 5D
+        channels_last_3d layout applies. The transformer works on token
+        sequences, where memory format has no effect; its launch overhead is
+        addressed by torch.compile's CUDA graphs instead.
+        """
+        try:
+            self.pipeline.vae.to(memory_format=torch.channels_last_3d)
+            logger.info("VAE converted to channels_last_3d memory format")
+        except Exception as e:
+            logger.warning(f"Could not convert VAE to channels_last_3d: {str(e)}")
+
+    def _install_prompt_cache(self):
+        """
+        Memoize the pipeline's encode_prompt across edit_image calls
+
+        Qwen-Image-Edit's text encoder is a VL model conditioned on both the
+        prompt and the input image, so results are keyed by the prompt, a
+        digest of the image, and the remaining encode arguments. Re-running
+        the same edit (e.g. tweaking steps or CFG) skips the encoder forward
+        for both the prompt and the negative prompt.
+        """
+        encode_prompt = getattr(type(self.pipeline), "encode_prompt", None)
+        if encode_prompt is None:
+            return
+
+        cache: "OrderedDict[tuple, tuple]" = OrderedDict()
+        image_digest = self._image_digest
+        # The wrapper is stored on the pipeline, so it holds neither the pipeline
+        # (nor its bound encode_prompt) nor self strongly: no reference cycle, and
+        # an evicted editor is freed by refcount without waiting for gc
+        pipeline_ref = weakref.ref(self.pipeline)
+
+        def cached_encode_prompt(prompt, image=None, **kwargs):
+            pipeline = pipeline_ref()
+            image_key = image_digest(image)
+            if image_key is None or kwargs.get("prompt_embeds") is not None:
+                return encode_prompt(pipeline, prompt, image=image, **kwargs)
+
+            prompt_key = tuple(prompt) if isinstance(prompt, list) else prompt
+            kwargs_key = tuple(sorted((k, str(v)) for k, v in kwargs.items()))
+            key = (prompt_key, image_key, kwargs_key)
+
+            if key in cache:
+                cache.move_to_end(key)
+                return cache[key]
+
+            result = encode_prompt(pipeline, prompt, image=image, **kwargs)
+            cache[key] = result
+            if len(cache) > PROMPT_CACHE_SIZE:
+                cache.popitem(last=False)
+            return result
+
+        self.pipeline.encode_prompt = cached_encode_prompt
+        self._prompt_cache = cache
+
+    @staticmethod
+    def _image_digest(image) -> Optional[tuple]:
+        """Hash PIL image(s) for cache keys; None for unhashable inputs (e.g. tensors)"""
+        images = image if isinstance(image, list) else [image]
+        key = []
+        for img in images:
+            if not isinstance(img, Image.Image):
+                return None
+            digest = hashlib.blake2b(img.tobytes(), digest_size=16).hexdigest()
+            key.append((img.mode, img.size, digest))
+        return tuple(key)
+
+    def _quantize_transformer(self):
+        """
+        Apply torchao weight-only quantization to the transformer linear layers
+
+        Falls back to the unquantized bf16 transformer if torchao is not
+        installed or the requested scheme is unsupported on this device.
+        """
+        try:
+            from torchao.quantization import quantize_, int8_weight_only, float8_weight_only
+        except ImportError:
+            logger.warning("torchao not installed, skipping transformer weight quantization")
+            return
+
+        schemes = {
+            "int8": int8_weight_only,
+            "fp8": float8_weight_only
+        }
+        scheme = schemes.get(self.weight_quantization)
+        if scheme is None:
+            raise ValueError(f"Unsupported weight quantization: {self.weight_quantization}. Supported: {list(schemes.keys())}")
+
+        try:
+            quantize_(self.pipeline.transformer, scheme())
+            logger.info(f"Quantized transformer weights to {self.weight_quantization}")
+        except Exception as e:
+            logger.warning(f"Weight quantization ({self.weight_quantization}) failed, using bf16: {str(e)}")
+
+    def _compile_transformer(self):
+        """
+        Compile the diffusion transformer with torch.compile
+
+        Compilation happens lazily on the first forward pass, so the first edit
+        pays the compile cost and later edits of the same size reuse the graph.
+        CUDA graphs (reduce-overhead) need weights at fixed device addresses, so
+        offloaded pipelines get kernel fusion only. Without torch.compile the
+        transformer stays eager; compile failures surface on that first forward
+        and are handled by _run_pipeline.
+        """
+        mode = "reduce-overhead" if self.offload is None else "max-autotune-no-cudagraphs"
+        try:
+            self.pipeline.transformer = torch.compile(
+                self.pipeline.transformer,
+                mode=mode,
+                fullgraph=False
+            )
+            self.compiled = True
+            logger.info(f"Compiled transformer with torch.compile ({mode}) on {self.device}")
+        except Exception as e:
+            logger.warning(f"torch.compile unavailable, using eager transformer: {str(e)}")
+
+    def _disable_compile(self):
+        """Swap the compiled transformer back for the original eager module"""
+        self.pipeline.transformer = getattr(self.pipeline.transformer, "_orig_mod", self.pipeline.transformer)
+        self.compiled = False
+        try:
+            torch._dynamo.reset()
+        except Exception:
+            pass
+
+    @staticmethod
+    def _is_compile_error(exc: BaseException) -> bool:
+        """
+        Whether an exception came from torch.compile itself
+
+        Dynamo and Inductor raise their own exception types (BackendCompilerFailed,
+        TorchRuntimeError, InductorError, ...) from torch._dynamo / torch._inductor.
+        Out-of-memory and ordinary pipeline errors are not compile errors.
+        """
+        if isinstance(exc, torch.cuda.OutOfMemoryError):
+            return False
+        return any(
+            cls.__module__.startswith(("torch._dynamo", "torch._inductor"))
+            for cls in type(exc).__mro__
+        )
+
+    def _run_pipeline(self, **kwargs):
+        """
+        Run the pipeline, falling back to eager mode if compilation fails
+
+        torch.compile only traces and compiles on the first forward pass, so
+        Dynamo/Inductor errors show up here rather than at load. If the first
+        compiled run fails with a compiler error, the original transformer is
+        restored and the edit is retried eagerly; later runs stay eager. OOM
+        and other pipeline errors propagate unchanged and keep compilation on.
+
+        Args:
+            **kwargs: Pipeline call arguments
+
+        Returns:
+            Pipeline output
+        """
+        try:
+            with torch.inference_mode(), self._attention_context():
+                output = self.pipeline(**kwargs)
+        except Exception as e:
+            if not self.compiled or self._compile_verified or not self._is_compile_error(e):
+                raise
+            logger.warning(f"Compiled transformer failed on its first run, falling back to eager: {str(e)}")
+            self._disable_compile()
+            output = None
+
+        # Retry outside the except block so the failed run's traceback
+        # (and the activations it pins) is released first
+        if output is None:
+            _release_gpu(full_gc=True)
+            with torch.inference_mode(), self._attention_context():
+                output = self.pipeline(**kwargs)
+
+        if self.compiled:
+            self._compile_verified = True
+        return output
+
     def _load_gguf_model(self, progress_callback: Optional[Callable[[int], None]] = None):
         """
         Load GGUF quantized model for faster inference and lower VRAM usage
@@ -76,18 +570,16 @@ class ImageEditor:
         while retry_count < max_retries:
             try:
                 from diffusers import QwenImageTransformer2DModel, GGUFQuantizationConfig, QwenImageEditPipeline
-                import gc
 
-                logger.info(f"Loading Qwen-Image-Edit-2509 GGUF pipeline ({self.quantization_level}) (attempt {retry_count + 1}/{max_retries})...")
+                # 2509 ships a native multi-image pipeline (diffusers >= 0.36) that
+                # encodes each input separately instead of one stitched canvas
+                try:
+                    from diffusers import QwenImageEditPlusPipeline
+                    pipeline_cls = QwenImageEditPlusPipeline
+                except ImportError:
+                    pipeline_cls = QwenImageEditPipeline
 
-                # Clear GPU cache before loading
-                if retry_count > 0:
-                    logger.info("Clearing GPU cache before retry...")
-                    if torch.cuda.is_available():
-                        torch.cuda.empty_cache()
-                    elif torch.backends.mps.is_available():
-                        torch.mps.empty_cache()
-                    gc.collect()
+                logger.info(f"Loading Qwen-Image-Edit-2509 GGUF pipeline ({self.quantization_level}) (attempt {retry_count + 1}/{max_retries})...")
 
                 if progress_callback:
                     progress_callback(0)
@@ -97,6 +589,7 @@ class ImageEditor:
                     "Q2_K": "https://huggingface.co/QuantStack/Qwen-Image-Edit-2509-GGUF/blob/main/Qwen-Image-Edit-2509-Q2_K.gguf",
                     "Q4_K_M": "https://huggingface.co/QuantStack/Qwen-Image-Edit-2509-GGUF/blob/main/Qwen-Image-Edit-2509-Q4_K_M.gguf",
                     "Q5_K_S": "https://huggingface.co/QuantStack/Qwen-Image-Edit-2509-GGUF/blob/main/Qwen-Image-Edit-2509-Q5_K_S.gguf",
+                    "Q6_K": "https://huggingface.co/QuantStack/Qwen-Image-Edit-2509-GGUF/blob/main/Qwen-Image-Edit-2509-Q6_K.gguf",
                     "Q8_0": "https://huggingface.co/QuantStack/Qwen-Image-Edit-2509-GGUF/blob/main/Qwen-Image-Edit-2509-Q8_0.gguf"
                 }
 
@@ -122,18 +615,23 @@ class ImageEditor:
                     progress_callback(60)
 
                 # Load the pipeline with quantized transformer
-                self.pipeline = QwenImageEditPipeline.from_pretrained(
+                self.pipeline = pipeline_cls.from_pretrained(
                     "Qwen/Qwen-Image-Edit-2509",
                     transformer=transformer,
                     torch_dtype=self.dtype
                 )
+                self.multi_image = pipeline_cls is not QwenImageEditPipeline
 
                 if progress_callback:
                     progress_callback(80)
 
                 # Move to device (CPU offloading recommended for GGUF)
-                if self.device == "mps" or self.device == "cuda":
+                if self.device == "cuda" and self._enable_group_offload():
+                    self.offload = "group"
+                    logger.info("Enabled streamed group offloading for GGUF model on cuda")
+                elif self.device == "mps" or self.device == "cuda":
                     self.pipeline.enable_model_cpu_offload()
+                    self.offload = "model"
                     logger.info(f"Enabled CPU offloading for GGUF model on {self.device}")
                 else:
                     self.pipeline.to(self.device)
@@ -156,20 +654,14 @@ class ImageEditor:
             except Exception as e:
                 retry_count += 1
 
-                # Aggressive cleanup on failure
-                import gc
-                if torch.cuda.is_available():
-                    torch.cuda.empty_cache()
-                elif torch.backends.mps.is_available():
-                    torch.mps.empty_cache()
-                gc.collect()
+                # Aggressive cleanup on failure (also clears the partial load before a retry)
+                _release_gpu(full_gc=True)
 
                 if retry_count >= max_retries:
                     logger.error(f"Failed to load GGUF model after {max_retries} attempts: {str(e)}")
                     raise
                 else:
                     logger.warning(f"Failed to load GGUF model (attempt {retry_count}), retrying: {str(e)}")
-                    import time
                     time.sleep(5)
 
     def _load_standard_model(self, progress_callback: Optional[Callable[[int], None]] = None):
@@ -185,19 +677,9 @@ class ImageEditor:
         while retry_count < max_retries:
             try:
                 from diffusers import QwenImageEditPipeline
-                import gc
 
                 logger.info(f"Loading Qwen-Image-Edit pipeline (attempt {retry_count + 1}/{max_retries})...")
 
-                # Clear GPU cache before loading (critical for retry attempts)
-                if retry_count > 0:
-                    logger.info("Clearing GPU cache before retry...")
-                    if torch.cuda.is_available():
-                        torch.cuda.empty_cache()
-                    elif torch.backends.mps.is_available():
-                        torch.mps.empty_cache()
-                    gc.collect()
-
                 # Note: Hugging Face doesn't provide granular download progress easily,
                 # but we can report key milestones
                 if progress_callback:
@@ -211,6 +693,11 @@ class ImageEditor:
                 if progress_callback:
                     progress_callback(80)
 
+                # Quantize transformer weights before moving to device
+                # (VAE and text encoder stay in bf16 - small and quality-sensitive)
+                if self.weight_quantization:
+                    self._quantize_transformer()
+
                 self.pipeline.to(self.device)
 
                 if progress_callback:
@@ -231,20 +718,14 @@ class ImageEditor:
             except Exception as e:
                 retry_count += 1
 
-                # Aggressive cleanup on failure
-                import gc
-                if torch.cuda.is_available():
-                    torch.cuda.empty_cache()
-                elif torch.backends.mps.is_available():
-                    torch.mps.empty_cache()
-                gc.collect()
+                # Aggressive cleanup on failure (also clears the partial load before a retry)
+                _release_gpu(full_gc=True)
 
                 if retry_count >= max_retries:
                     logger.error(f"Failed to load Qwen-Image-Edit model after {max_retries} attempts: {str(e)}")
                     raise
                 else:
                     logger.warning(f"Failed to load model (attempt {retry_count}), retrying: {str(e)}")
-                    import time
                     time.sleep(5)  # Wait before retry
 
     def edit_image(
@@ -253,23 +734,29 @@ class ImageEditor:
         prompt: str,
         negative_prompt: Optional[str] = None,
         true_cfg_scale: float = 4.0,
-        num_inference_steps: int = 50,
+        num_inference_steps: int = 25,
         output_path: str = "output.jpg",
         progress_callback: Optional[Callable] = None,
-        is_cancelled: Optional[Callable[[], bool]] = None
+        is_cancelled: Optional[Callable[[], bool]] = None,
+        max_side: Optional[int] = MAX_INPUT_SIDE,
+        upscale_to_input: bool = False
     ) -> str:
         """
         Edit image(s) using Qwen-Image-Edit-2509-GGUF model
 
         Args:
-            image_paths: List of 1-2 image paths
+            image_paths: List of 1-2 image paths (passed to the pipeline as separate
+                images when it supports them, otherwise combined side-by-side)
             prompt: Edit instruction
             negative_prompt: What to avoid in the output
             true_cfg_scale: Classifier-free guidance scale (default: 4.0)
-            num_inference_steps: Number of diffusion steps (default: 50)
+            num_inference_steps: Number of diffusion steps (default: 25)
             output_path: Where to save the edited image
             progress_callback: Optional callback for progress updates
             is_cancelled: Optional callback to check if job is cancelled
+            max_side: Downscale inputs whose longest side exceeds this (None to disable)
+            upscale_to_input: Resize the result back to the original size when a
+                single input was downscaled (default: keep the pipeline's output size)
 
         Returns:
             Path to the edited image
@@ -285,15 +772,31 @@ class ImageEditor:
             if progress_callback:
                 progress_callback("loading_images", "Loading input images...", 30)
 
-            # Load images with EXIF preservation
+            # Open images lazily (header only) so sizes are known before decoding
+            opened = [Image.open(img_path) for img_path in image_paths]
+            original_size = self._oriented_size(opened[0])
+
+            # Images are downscaled to the max_side cap and, when combining, to the
+            # shortest (capped) height of all inputs, so JPEGs can be decoded
+            # directly at a reduced DCT scale covering that height.
+            combine = len(opened) > 1 and not self.multi_image
+            target_heights = [self._capped_height(img, max_side) for img in opened]
+            if combine:
+                target_heights = [min(target_heights)] * len(opened)
+            for img, target_height in zip(opened, target_heights):
+                self._draft_for_height(img, target_height)
+
+            # Load images, applying EXIF orientation so the model sees upright pixels
             images = []
             exif_data = None
-            for i, img_path in enumerate(image_paths):
-                img = Image.open(img_path)
-                # Preserve EXIF from first image
-                if i == 0 and hasattr(img, 'info'):
+            for i, (img_path, img) in enumerate(zip(image_paths, opened)):
+                img = ImageOps.exif_transpose(img)
+                # Preserve EXIF from first image (orientation tag already cleared)
+                if i == 0:
                     exif_data = img.info.get('exif')
                 img = img.convert('RGB')
+                if max_side and max(img.size) > max_side:
+                    img = self._fit_max_side(img, max_side)
                 images.append(img)
                 logger.info(f"Loaded image: {img_path}, size: {img.size}")
 
@@ -304,6 +807,9 @@ class ImageEditor:
             # Handle single vs multi-image
             if len(images) == 1:
                 input_image = images[0]
+            elif not combine:
+                # Pipeline batches the inputs through the VAE encoder itself
+                input_image = images
             else:
                 # Combine two images side-by-side
                 if progress_callback:
@@ -319,7 +825,7 @@ class ImageEditor:
 
             # Run inference
             logger.info(f"Starting inference with prompt: '{prompt}'")
-            output = self.pipeline(
+            output = self._run_pipeline(
                 image=input_image,
                 prompt=prompt,
                 negative_prompt=negative_prompt or "",
@@ -334,50 +840,142 @@ class ImageEditor:
             # Extract the edited image
             edited_image = output.images[0]
 
+            # Optionally restore a downscaled single input's original dimensions
+            if upscale_to_input and len(images) == 1 and images[0].size != original_size:
+                edited_image = edited_image.resize(original_size, Image.Resampling.LANCZOS)
+
             if progress_callback:
                 progress_callback("saving", "Saving edited image...", 95)
 
             # Save output with EXIF if available
-            save_kwargs = {'quality': 95}
+            save_kwargs = self._output_save_kwargs(output_path)
             if exif_data:
                 save_kwargs['exif'] = exif_data
 
-            edited_image.save(output_path, **save_kwargs)
-            logger.info(f"Saved edited image to: {output_path}")
+            # Encode on a worker thread so the JPEG encode overlaps GPU cleanup below
+            save_future = _SAVE_POOL.submit(edited_image.save, output_path, **save_kwargs)
 
-            # Aggressive GPU cache cleanup after inference
-            import gc
-            # Delete intermediate tensors
+            # GPU cache cleanup after inference: dropping the references frees the
+            # tensors; only flush the caching allocator when it holds a lot of unused
+            # memory, since back-to-back jobs otherwise reuse the pooled blocks
             del output
             del edited_image
             del input_image
             del images
-            # Force garbage collection
-            gc.collect()
-            # Clear PyTorch cache
+            _release_gpu(threshold=EMPTY_CACHE_THRESHOLD)
             if torch.cuda.is_available():
-                torch.cuda.empty_cache()
-                # Log memory usage
                 allocated = torch.cuda.memory_allocated() / 1024**3
                 reserved = torch.cuda.memory_reserved() / 1024**3
                 logger.info(f"GPU Memory after cleanup: {allocated:.2f} GB allocated, {reserved:.2f} GB reserved")
-            elif self.device == "mps":
-                torch.mps.empty_cache()
-                logger.info("MPS cache cleared after inference")
+
+            # Callers copy/serve the file as soon as we return, so wait for it here
+            save_future.result()
+            logger.info(f"Saved edited image to: {output_path}")
 
             return output_path
 
         except Exception as e:
-            # Aggressive cleanup on error too
-            import gc
-            gc.collect()
-            if torch.cuda.is_available():
-                torch.cuda.empty_cache()
-            elif self.device == "mps":
-                torch.mps.empty_cache()
+            # Aggressive cleanup on error too (the traceback may still pin tensors)
+            _release_gpu(full_gc=True)
             logger.error(f"Error during image editing: {str(e)}")
             raise
 
+    @staticmethod
+    def _output_save_kwargs(output_path: str) -> dict:
+        """
+        Encoder settings for the edited image, chosen by file extension
+
+        JPEG uses quality 90 with 4:2:0 chroma subsampling (visually lossless
+        for model output, much smaller and faster to encode than quality 95).
+        """
+        if output_path.lower().endswith('.webp'):
+            return {'quality': 88, 'method': 4}
+        return {'quality': 90, 'subsampling': '4:2:0'}
+
+    def _configure_attention(self):
+        """
+        Fall back to xFormers attention when SDPA kernel selection is unavailable
+
+        PyTorch 2.3+ runs the transformer on SDPA's flash / memory-efficient
+        kernels (see _attention_context). On older builds, route attention
+        through xFormers via the diffusers attention dispatcher, which keeps
+        Qwen's joint text-image attention processors intact (the legacy
+        enable_xformers_memory_efficient_attention() would replace them).
+        """
+        try:
+            from torch.nn.attention import sdpa_kernel  # noqa: F401
+            logger.info("Using PyTorch SDPA flash/memory-efficient attention")
+            return
+        except ImportError:
+            pass
+
+        try:
+            import xformers  # noqa: F401
+            self.pipeline.transformer.set_attention_backend("xformers")
+            self.attention_backend = "xformers"
+            logger.info("Using xFormers memory-efficient attention")
+        except Exception as e:
+            logger.info(f"xFormers attention unavailable, using default SDPA: {str(e)}")
+
+    def _attention_context(self):
+        """
+        Prefer the flash / memory-efficient SDPA kernels during inference
+
+        The Qwen transformer's attention processors already call
+        scaled_dot_product_attention; on CUDA this steers SDPA away from the
+        O(N^2) math backend (kept as a fallback for unsupported shapes).
+        """
+        if self.device != "cuda":
+            return nullcontext()
+        try:
+            from torch.nn.attention import SDPBackend, sdpa_kernel
+        except ImportError:
+            return nullcontext()
+        return sdpa_kernel([
+            SDPBackend.FLASH_ATTENTION,
+            SDPBackend.EFFICIENT_ATTENTION,
+            SDPBackend.MATH
+        ])
+
+    @staticmethod
+    def _draft_for_height(img: Image.Image, target_height: int) -> None:
+        """
+        Let libjpeg decode at the smallest 1/N scale that still covers target_height
+
+        Args:
+            img: Lazily opened image (no-op for non-JPEG formats)
+            target_height: Upright height the image will be resized to afterwards
+        """
+        oriented_height = ImageEditor._oriented_size(img)[1]
+        if img.format != 'JPEG' or oriented_height <= target_height:
+            return
+        # draft() works in stored (pre-rotation) coordinates, so scale both axes
+        scale = target_height / oriented_height
+        img.draft('RGB', (math.ceil(img.width * scale), math.ceil(img.height * scale)))
+
+    @staticmethod
+    def _capped_height(img: Image.Image, max_side: Optional[int]) -> int:
+        """Upright height of a lazily opened image after the max_side cap"""
+        width, height = ImageEditor._oriented_size(img)
+        if max_side and max(width, height) > max_side:
+            return math.ceil(height * max_side / max(width, height))
+        return height
+
+    @staticmethod
+    def _fit_max_side(img: Image.Image, max_side: int) -> Image.Image:
+        """Downscale an image so its longest side is max_side, keeping the aspect ratio"""
+        scale = max_side / max(img.size)
+        size = (max(1, round(img.width * scale)), max(1, round(img.height * scale)))
+        return img.resize(size, Image.Resampling.LANCZOS, reducing_gap=3.0)
+
+    @staticmethod
+    def _oriented_size(img: Image.Image) -> tuple:
+        """Image size after EXIF orientation is applied, read from the header only"""
+        orientation = img.getexif().get(0x0112, 1)
+        if orientation in (5, 6, 7, 8):
+            return img.height, img.width
+        return img.size
+
     def _combine_images(self, img1: Image.Image, img2: Image.Image) -> Image.Image:
         """
         Combine two images side-by-side for multi-image editing
@@ -396,17 +994,21 @@ class ImageEditor:
         new_width1 = int(img1.width * (target_height / img1.height))
         new_width2 = int(img2.width * (target_height / img2.height))
 
-        # Resize both images
-        img1_resized = img1.resize((new_width1, target_height), Image.Resampling.LANCZOS)
-        img2_resized = img2.resize((new_width2, target_height), Image.Resampling.LANCZOS)
+        # The pipeline downsamples the canvas again, so bilinear is enough unless
+        # the canvas is already small. reducing_gap lets Pillow do a cheap integer
+        # box reduction first and run the filter only for the final (<3x) step.
+        resample = Image.Resampling.LANCZOS if target_height < 512 else Image.Resampling.BILINEAR
 
-        # Create combined canvas
-        total_width = new_width1 + new_width2
-        combined = Image.new('RGB', (total_width, target_height))
+        # The image that already has the target height needs no resize
+        img1_resized = img1 if img1.height == target_height else img1.resize((new_width1, target_height), resample, reducing_gap=3.0)
+        img2_resized = img2 if img2.height == target_height else img2.resize((new_width2, target_height), resample, reducing_gap=3.0)
 
-        # Paste images side-by-side
-        combined.paste(img1_resized, (0, 0))
-        combined.paste(img2_resized, (new_width1, 0))
+        # Fill one contiguous canvas side-by-side (no zero-fill, no per-paste mode checks)
+        total_width = new_width1 + new_width2
+        canvas = np.empty((target_height, total_width, 3), dtype=np.uint8)
+        canvas[:, :new_width1] = np.asarray(img1_resized)
+        canvas[:, new_width1:] = np.asarray(img2_resized)
+        combined = Image.fromarray(canvas, 'RGB')
 
         logger.info(f"Combined images: {combined.size}")
         return combined
@@ -419,6 +1021,12 @@ class ImageEditor:
             "model": model_name,
             "device": self.device,
             "dtype": dtype_str,
-            "quantized": self.use_gguf,
+            "quantized": self.use_gguf or bool(self.weight_quantization),
+            "weight_quantization": self.weight_quantization,
+            "bits_per_weight": GGUF_BITS_PER_WEIGHT.get(self.quantization_level) if self.use_gguf else None,
+            "compiled": self.compiled,
+            "offload": self.offload,
+            "attention_backend": self.attention_backend,
+            "multi_image": self.multi_image,
             "loaded": self.pipeline is not None
         }
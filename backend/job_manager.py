@@ -3,26 +3,76 @@ Job Manager for tracking image editing jobs
 Handles in-memory state, disk persistence, and WebSocket broadcasting
 """
 
+import os
 import json
 import time
+import uuid
 import shutil
 import asyncio
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from pathlib import Path
-from typing import Dict, Optional, List, Any
-from threading import Lock, Event
+from typing import Callable, Dict, List, Optional, Any
+from threading import Lock, Event, Thread
 import logging
 
 from models import JobStatus
 
+try:
+    import orjson
+except ImportError:  # orjson is optional; fall back to stdlib json
+    orjson = None
+
 logger = logging.getLogger(__name__)
 
+# Threads used to read job metadata in parallel at startup (I/O-bound)
+LOAD_WORKERS = max(1, int(os.getenv('JOB_LOAD_WORKERS', '16')))
+
+# Snapshot of all finished jobs in one file, so startup reads one file instead of N
+INDEX_FILENAME = '_index.json'
+
+
+def _dumps(data: Any) -> bytes:
+    """Serialize job metadata compactly (orjson when available)"""
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, separators=(',', ':')).encode()
+
+
+def _loads(data: bytes) -> dict:
+    """Parse job metadata (orjson when available)"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def _write_atomic(path: str, payload: bytes) -> None:
+    """
+    Replace a file's contents atomically
+
+    Writes and fsyncs path.tmp, then renames it over path, so a crash or kill
+    mid-write leaves either the old file or the new one, never a truncated one.
+    """
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(payload)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
 
 class JobManager:
     """
     Manages image editing jobs lifecycle
     - In-memory state tracking
-    - Disk persistence (metadata.json)
+    - Disk persistence (metadata.json per job, plus _index.json of finished jobs)
     - WebSocket connection registry
+
+    Thread safety: get_job, is_cancelled and request_cancellation are lock-free
+    single-key dict reads (atomic under the GIL) and never wait on writers, so
+    inference threads can poll cancellation every step. Writers take the lock
+    for the registry they mutate, or the per-job lock for a job's fields.
     """
 
     def __init__(self, jobs_dir: Path, event_loop: Optional[asyncio.AbstractEventLoop] = None):
@@ -35,13 +85,40 @@ class JobManager:
         """
         self.jobs_dir = Path(jobs_dir)
         self.jobs: Dict[str, dict] = {}
-        self.ws_connections: Dict[str, List] = {}  # job_id -> [websockets]
+        self.ws_connections: Dict[str, set] = {}  # job_id -> {websockets}
         self.cancellation_events: Dict[str, Event] = {}  # job_id -> cancellation event
         self.job_tasks: Dict[str, asyncio.Task] = {}  # job_id -> background task
-        self.lock = Lock()
+        # Each registry has its own lock, so e.g. a WebSocket connecting never waits
+        # on a status update. Single-key reads rely on dict.get being atomic under the GIL.
+        self.lock = Lock()  # Guards inserts/deletes on jobs, _job_locks and _status_counts
+        self._task_lock = Lock()  # Guards job_tasks and cancellation_events
+        self._ws_lock = Lock()  # Guards ws_connections and _ws_count
+        self._ws_count = 0  # Total connections across all jobs, for get_stats
+        self._job_locks: Dict[str, Lock] = {}  # job_id -> lock for that job's fields
+        self._status_counts: Counter = Counter()  # status -> number of jobs (guarded by self.lock)
         self.event_loop = event_loop
-        self._pending_writes: Dict[str, float] = {}  # job_id -> last_update_time
-        self._write_interval = 2.0  # Write to disk at most every 2 seconds
+        self._broadcast_pending: set = set()  # job_ids awaiting the next broadcast (loop thread only)
+        self._broadcast_delay = 0.1  # Cork window: progress ticks within it go out as one message (<=10/s per job)
+        self._broadcast_wanted: Optional[asyncio.Event] = None
+        self._broadcaster: Optional[asyncio.Task] = None
+        self._last_broadcast: Dict[str, tuple] = {}  # job_id -> content last sent (loop thread only)
+        self._send_timeout = 1.0  # A client slower than this to accept a message is dropped (seconds)
+        self._close_tasks: set = set()  # In-flight closes of dropped WebSockets (strong refs)
+        self._dirty: set = set()  # job_ids with progress not yet written to disk
+        self._flush_delay = 0.5  # Debounce window: updates landing within it share one write (seconds)
+        self._flush_wanted = Event()  # Set when _dirty gains a job; the flusher sleeps until then
+        self._stop_flusher = Event()
+        self._write_lock = Lock()  # Serializes snapshot+write so an older snapshot never lands last
+        self._last_written: Dict[str, bytes] = {}  # job_id -> bytes currently in metadata.json
+        self._jobs_root = str(self.jobs_dir)  # Plain-string paths on the save path (no Path objects)
+        self._made_dirs: set = set()  # job_ids whose directory is known to exist (guarded by _write_lock)
+        self._save_tasks: set = set()  # In-flight off-loop metadata writes (strong refs)
+        self._index_file = self.jobs_dir / INDEX_FILENAME
+        self._index_dirty = False  # Set when a finished job is written or a job is deleted
+        self._last_index: Optional[bytes] = None
+        # Encoded index entry (b'"<id>":{...}') per finished job, refreshed only when
+        # that job's metadata is written, so an index write re-encodes nothing
+        self._index_entries: Dict[str, bytes] = {}
 
         # Ensure jobs directory exists
         self.jobs_dir.mkdir(parents=True, exist_ok=True)
@@ -49,61 +126,189 @@ class JobManager:
         # Load existing jobs from disk
         self._load_jobs_from_disk()
 
+        # Progress updates are persisted by a background thread instead of inline
+        self._flusher = Thread(target=self._flush_loop, name="job-metadata-flusher", daemon=True)
+        self._flusher.start()
+
     def _load_jobs_from_disk(self):
         """
         Load existing job metadata from disk on startup
         Clean up corrupted or old jobs automatically
+
+        Job directories are probed on a thread pool (the work is file I/O,
+        which releases the GIL); results are merged here on the calling thread.
         """
         if not self.jobs_dir.exists():
             return
 
+        index, index_mtime = self._read_index()
+
+        results = []
+        job_dirs = []
+        with os.scandir(self.jobs_dir) as it:
+            for entry in it:
+                # DirEntry.is_dir uses the file type readdir already returned (no stat)
+                if not entry.is_dir(follow_symlinks=False):
+                    continue
+                # Trust the index for jobs whose directory hasn't changed since it
+                # was written; anything newer (e.g. after a crash) is read from disk
+                job_data = index.get(entry.name)
+                if job_data is not None and entry.stat().st_mtime <= index_mtime:
+                    results.append(('load', entry.name, job_data))
+                else:
+                    job_dirs.append(Path(entry.path))
+
+        if job_dirs:
+            with ThreadPoolExecutor(max_workers=min(LOAD_WORKERS, len(job_dirs))) as pool:
+                results.extend(pool.map(self._probe_job_dir, job_dirs))
+
+        # Rewrite the index on the first flush if it no longer matches the directories
+        if job_dirs or len(results) != len(index):
+            self._index_dirty = True
+            self._flush_wanted.set()
+
         cleaned_count = 0
         loaded_count = 0
 
-        for job_dir in self.jobs_dir.iterdir():
-            if job_dir.is_dir():
-                metadata_file = job_dir / 'metadata.json'
-
-                # If metadata file doesn't exist or is empty, delete the job
-                if not metadata_file.exists() or metadata_file.stat().st_size == 0:
-                    logger.warning(f"Removing job {job_dir.name} - missing or empty metadata")
-                    try:
-                        shutil.rmtree(job_dir)
-                        cleaned_count += 1
-                    except Exception as e:
-                        logger.error(f"Error removing corrupted job {job_dir.name}: {str(e)}")
-                    continue
+        # Insert oldest first: self.jobs then stays in creation order (new jobs
+        # are appended), which jobs_created_before relies on
+        results.sort(key=lambda result: (result[2] or {}).get('created_at') or 0)
 
-                try:
-                    with open(metadata_file, 'r') as f:
-                        job_data = json.load(f)
-
-                    # Only load completed or error jobs (not processing)
-                    # Processing jobs from previous run are invalid
-                    if job_data.get('status') == 'processing':
-                        logger.info(f"Removing stale processing job {job_dir.name} from previous run")
-                        shutil.rmtree(job_dir)
-                        cleaned_count += 1
-                    else:
-                        self.jobs[job_dir.name] = job_data
-                        loaded_count += 1
-                        logger.info(f"Loaded job {job_dir.name} from disk")
-
-                except json.JSONDecodeError as e:
-                    logger.warning(f"Removing job {job_dir.name} - corrupted metadata: {str(e)}")
-                    try:
-                        shutil.rmtree(job_dir)
-                        cleaned_count += 1
-                    except Exception as e:
-                        logger.error(f"Error removing corrupted job {job_dir.name}: {str(e)}")
-                except Exception as e:
-                    logger.error(f"Error loading job {job_dir.name}: {str(e)}")
+        for outcome, job_id, job_data in results:
+            if outcome == 'load':
+                self.jobs[job_id] = job_data
+                self._job_locks[job_id] = Lock()
+                self._status_counts[job_data.get('status')] += 1
+                loaded_count += 1
+            elif outcome == 'clean':
+                cleaned_count += 1
 
         if cleaned_count > 0:
             logger.info(f"Cleaned up {cleaned_count} corrupted/stale jobs on startup")
         if loaded_count > 0:
             logger.info(f"Loaded {loaded_count} valid jobs from disk")
 
+    def _probe_job_dir(self, job_dir: Path) -> tuple:
+        """
+        Read one job directory's metadata, removing it if corrupted or stale
+
+        Args:
+            job_dir: Job directory
+
+        Returns:
+            Tuple of (outcome, job_id, job_data) where outcome is 'load' (job_data
+            set), 'clean' (directory removed) or 'skip' (left as is)
+        """
+        metadata_file = job_dir / 'metadata.json'
+
+        # A leftover temp file means a write was interrupted; metadata.json
+        # still holds the last complete version
+        try:
+            os.unlink(job_dir / 'metadata.json.tmp')
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.warning(f"Could not remove stale temp file in {job_dir.name}: {str(e)}")
+
+        # One open+read instead of exists() + stat() + open(); a missing file
+        # reads as empty
+        try:
+            data = metadata_file.read_bytes()
+        except FileNotFoundError:
+            data = b''
+        except Exception as e:
+            logger.error(f"Error loading job {job_dir.name}: {str(e)}")
+            return 'skip', job_dir.name, None
+
+        # If metadata file doesn't exist or is empty, delete the job
+        if not data:
+            logger.warning(f"Removing job {job_dir.name} - missing or empty metadata")
+            return self._remove_job_dir(job_dir)
+
+        try:
+            job_data = _loads(data)
+
+            # Only load completed or error jobs (not processing)
+            # Processing jobs from previous run are invalid
+            if job_data.get('status') == 'processing':
+                logger.info(f"Removing stale processing job {job_dir.name} from previous run")
+                return self._remove_job_dir(job_dir)
+
+            logger.info(f"Loaded job {job_dir.name} from disk")
+            return 'load', job_dir.name, job_data
+
+        except json.JSONDecodeError as e:
+            logger.warning(f"Removing job {job_dir.name} - corrupted metadata: {str(e)}")
+            return self._remove_job_dir(job_dir)
+        except Exception as e:
+            logger.error(f"Error loading job {job_dir.name}: {str(e)}")
+            return 'skip', job_dir.name, None
+
+    def _read_index(self) -> tuple:
+        """
+        Read the jobs index written by the flusher
+
+        Returns:
+            Tuple of (job_id -> job data, index mtime); ({}, 0.0) if the index
+            is missing or unreadable
+        """
+        try:
+            index_mtime = self._index_file.stat().st_mtime
+            index = _loads(self._index_file.read_bytes())
+        except FileNotFoundError:
+            return {}, 0.0
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable jobs index: {str(e)}")
+            return {}, 0.0
+
+        if not isinstance(index, dict):
+            return {}, 0.0
+        return index, index_mtime
+
+    def _write_index(self) -> None:
+        """
+        Write all finished jobs to the index file
+
+        Processing jobs are left out; they don't survive a restart. Entries
+        come from _index_entries, so only jobs without one yet (loaded at
+        startup) are encoded here, once.
+        """
+        self._index_dirty = False
+
+        try:
+            with self._write_lock:
+                index_entries = self._index_entries
+                entries = []
+                for job_id, job in list(self.jobs.items()):
+                    entry = index_entries.get(job_id)
+                    if entry is None:
+                        job_lock = self._job_locks.get(job_id)
+                        if job_lock is None:
+                            continue
+                        with job_lock:
+                            if job['status'] == JobStatus.PROCESSING.value:
+                                continue
+                            entry = index_entries[job_id] = _dumps(job_id) + b':' + _dumps(job)
+                    entries.append(entry)
+
+                payload = b'{' + b','.join(entries) + b'}'
+                if payload == self._last_index:
+                    return
+                _write_atomic(str(self._index_file), payload)
+                self._last_index = payload
+        except Exception as e:
+            logger.error(f"Error writing jobs index: {str(e)}")
+
+    @staticmethod
+    def _remove_job_dir(job_dir: Path) -> tuple:
+        """Delete a corrupted/stale job directory, returning its _probe_job_dir outcome"""
+        try:
+            shutil.rmtree(job_dir)
+            return 'clean', job_dir.name, None
+        except Exception as e:
+            logger.error(f"Error removing corrupted job {job_dir.name}: {str(e)}")
+            return 'skip', job_dir.name, None
+
     def create_job(self, config: dict) -> str:
         """
         Create a new job
@@ -114,9 +319,12 @@ class JobManager:
         Returns:
             job_id: Unique job identifier
         """
-        import uuid
+        # 32 hex chars (no dashes): shorter dict keys and directory names
+        job_id = uuid.uuid4().hex
 
-        job_id = str(uuid.uuid4())
+        # Create cancellation event for this job
+        with self._task_lock:
+            self.cancellation_events[job_id] = Event()
 
         with self.lock:
             self.jobs[job_id] = {
@@ -127,19 +335,55 @@ class JobManager:
                 'error': None,
                 'created_at': time.time()
             }
-            # Create cancellation event for this job
-            self.cancellation_events[job_id] = Event()
+            self._job_locks[job_id] = Lock()
+            self._status_counts[JobStatus.PROCESSING.value] += 1
 
         # Save to disk immediately for new jobs
-        self._save_job_metadata(job_id, force=True)
+        self._save_now(job_id)
 
         logger.info(f"Created job {job_id}")
         return job_id
 
     def get_job(self, job_id: str) -> Optional[dict]:
-        """Get job data by ID"""
+        """Get job data by ID (lock-free)"""
+        return self.jobs.get(job_id)
+
+    def jobs_created_before(self, cutoff: float) -> List[str]:
+        """
+        IDs of jobs created before a timestamp
+
+        self.jobs is kept in creation order, so the scan stops at the first
+        job at or past the cutoff instead of visiting every job.
+
+        Args:
+            cutoff: Unix timestamp
+
+        Returns:
+            Job IDs, oldest first
+        """
+        job_ids = []
         with self.lock:
-            return self.jobs.get(job_id)
+            for job_id, job in self.jobs.items():
+                if (job.get('created_at') or 0) >= cutoff:
+                    break
+                job_ids.append(job_id)
+        return job_ids
+
+    def _locked_job(self, job_id: str):
+        """
+        Look up a job and its per-job lock without taking the global lock
+
+        Single dict reads are atomic under the GIL; the global lock is only
+        needed to insert or delete jobs.
+
+        Returns:
+            Tuple of (job dict, Lock), or (None, None) if the job doesn't exist
+        """
+        job = self.jobs.get(job_id)
+        job_lock = self._job_locks.get(job_id)
+        if job is None or job_lock is None:
+            return None, None
+        return job, job_lock
 
     def update_job_data(self, job_id: str, updates: dict) -> None:
         """
@@ -149,14 +393,15 @@ class JobManager:
             job_id: Job identifier
             updates: Dictionary of fields to update
         """
-        with self.lock:
-            if job_id not in self.jobs:
-                logger.warning(f"Job {job_id} not found")
-                return
-            self.jobs[job_id].update(updates)
+        job, job_lock = self._locked_job(job_id)
+        if job is None:
+            logger.warning(f"Job {job_id} not found")
+            return
+        with job_lock:
+            job.update(updates)
 
         # Save to disk immediately
-        self._save_job_metadata(job_id, force=True)
+        self._save_now(job_id)
         logger.info(f"Updated job {job_id} data: {list(updates.keys())}")
 
     def set_event_loop(self, loop: asyncio.AbstractEventLoop) -> None:
@@ -166,24 +411,73 @@ class JobManager:
 
     def register_task(self, job_id: str, task: asyncio.Task) -> None:
         """Register a background task for a job"""
-        with self.lock:
+        with self._task_lock:
             self.job_tasks[job_id] = task
+        # Drop the entry once the task finishes, however it exits
+        task.add_done_callback(lambda done: self._forget_task(job_id, done))
         logger.info(f"Registered task for job {job_id}")
 
-    def is_cancelled(self, job_id: str) -> bool:
-        """Check if a job has been cancelled"""
-        with self.lock:
+    def _forget_task(self, job_id: str, task: asyncio.Task) -> None:
+        """Remove a finished task from job_tasks (unless it was already replaced)"""
+        with self._task_lock:
+            if self.job_tasks.get(job_id) is task:
+                del self.job_tasks[job_id]
+
+    def _reap_cancellation_event(self, job_id: str) -> None:
+        """
+        Drop a finished job's cancellation event
+
+        A set event is kept until delete_job, so an inference thread still
+        running after its task was cancelled keeps seeing the cancellation.
+        """
+        with self._task_lock:
             event = self.cancellation_events.get(job_id)
-            return event.is_set() if event else False
+            if event is not None and not event.is_set():
+                del self.cancellation_events[job_id]
+
+    def is_cancelled(self, job_id: str) -> bool:
+        """
+        Check if a job has been cancelled (lock-free; polled every inference step)
+
+        Finished jobs have no event and report False; deleted jobs report True,
+        so work still running for them stops.
+        """
+        event = self.cancellation_events.get(job_id)
+        if event is not None:
+            return event.is_set()
+        return job_id not in self.jobs
+
+    def get_cancellation_event(self, job_id: str) -> Optional[Event]:
+        """
+        Get a job's cancellation event (lock-free)
+
+        For workers that wait between steps: event.wait(timeout) returns as soon
+        as the job is cancelled instead of sleeping out the full timeout.
+        """
+        return self.cancellation_events.get(job_id)
+
+    def cancellation_checker(self, job_id: str) -> Callable[[], bool]:
+        """
+        Get a cheap zero-argument cancellation check for one job
+
+        Returns the job event's bound is_set, so hot loops (every inference
+        step, every progress update) skip the registry lookup entirely. Falls
+        back to is_cancelled if the job has no event.
+        """
+        event = self.cancellation_events.get(job_id)
+        if event is not None:
+            return event.is_set
+        return partial(self.is_cancelled, job_id)
 
     def request_cancellation(self, job_id: str) -> bool:
         """Request cancellation of a job"""
-        with self.lock:
-            if job_id in self.cancellation_events:
-                self.cancellation_events[job_id].set()
-                logger.info(f"Cancellation requested for job {job_id}")
-                return True
+        # Event.set() is thread-safe; no registry lock needed
+        event = self.cancellation_events.get(job_id)
+        if event is None:
             return False
+        event.set()
+        logger.info(f"Cancellation requested for job {job_id}")
+        return True
 
     def set_status(self, job_id: str, status: JobStatus, error: Optional[str] = None) -> None:
         """
@@ -194,17 +488,31 @@ class JobManager:
             status: New status
             error: Error message if status is ERROR
         """
-        with self.lock:
-            if job_id not in self.jobs:
-                logger.warning(f"Job {job_id} not found")
-                return
+        job, job_lock = self._locked_job(job_id)
+        if job is None:
+            logger.warning(f"Job {job_id} not found")
+            return
 
-            self.jobs[job_id]['status'] = status.value
+        with job_lock:
+            previous = job['status']
+            job['status'] = status.value
             if error:
-                self.jobs[job_id]['error'] = error
+                job['error'] = error
+            if status == JobStatus.PROCESSING:
+                self._mark_dirty(job_id)
+
+        if previous != status.value:
+            with self.lock:
+                # Skip if delete_job removed (and uncounted) the job meanwhile
+                if job_id in self.jobs:
+                    self._status_counts[previous] -= 1
+                    self._status_counts[status.value] += 1
 
-        # Always save immediately for status changes (critical state)
-        self._save_job_metadata(job_id, force=True)
+        # Terminal statuses are written immediately (durability trigger);
+        # entering processing is coalesced with the progress updates that follow
+        if status != JobStatus.PROCESSING:
+            self._reap_cancellation_event(job_id)
+            self._save_now(job_id)
 
         # Broadcast to WebSocket clients
         self._schedule_broadcast(job_id)
@@ -229,63 +537,154 @@ class JobManager:
         """
         current_time = time.time()
 
-        with self.lock:
-            if job_id not in self.jobs:
-                logger.warning(f"Job {job_id} not found")
-                return
+        job, job_lock = self._locked_job(job_id)
+        if job is None:
+            logger.warning(f"Job {job_id} not found")
+            return
 
-            self.jobs[job_id]['progress'] = {
+        with job_lock:
+            previous = job.get('progress')
+            job['progress'] = {
                 'stage': stage,
                 'message': message,
                 'progress': progress,
                 'updated_at': current_time
             }
 
-            # Track pending write
-            last_write = self._pending_writes.get(job_id, 0)
-            force_write = (current_time - last_write) >= self._write_interval
-
-        # Save to disk only if enough time has passed (batching)
-        # or if it's a critical progress point (0%, 100%)
-        if force_write or progress in [0, 100]:
-            self._save_job_metadata(job_id, force=True)
-            with self.lock:
-                self._pending_writes[job_id] = current_time
-        else:
-            # Just mark as dirty, will be written on next forced write
-            self._save_job_metadata(job_id, force=False)
+            # Written by the background flusher; terminal statuses still write immediately
+            self._mark_dirty(job_id)
 
-        # Broadcast to WebSocket clients
-        self._schedule_broadcast(job_id)
+        # Always stored, but only broadcast when clients would see a difference
+        # (a repeat with just a new timestamp isn't worth the cross-thread hop)
+        if (
+            previous is None
+            or previous.get('progress') != progress
+            or previous.get('stage') != stage
+            or previous.get('message') != message
+        ):
+            self._schedule_broadcast(job_id)
 
-    def _save_job_metadata(self, job_id: str, force: bool = False) -> None:
+    def _save_job_metadata(self, job_id: str) -> None:
         """
         Save job metadata to disk
 
+        Writes to a temp file and renames it over metadata.json, so readers
+        (and a crash mid-write) never see a truncated file.
+
         Args:
             job_id: Job identifier
-            force: If True, write immediately; if False, skip if recently written
         """
-        if not force:
-            # Skip write if not forced (batching optimization)
-            return
-
         try:
-            with self.lock:
-                if job_id not in self.jobs:
+            with self._write_lock:
+                job, job_lock = self._locked_job(job_id)
+                if job is None:
+                    return
+                # Encode straight from the live dict under its lock: the bytes are
+                # the snapshot, so no defensive copy is needed
+                with job_lock:
+                    self._dirty.discard(job_id)
+                    payload = _dumps(job)
+                    finished = job['status'] != JobStatus.PROCESSING.value
+
+                # The index reuses these bytes as the job's entry
+                if finished:
+                    self._index_entries[job_id] = _dumps(job_id) + b':' + payload
+
+                # Skip the write entirely if the file already holds these bytes
+                if self._last_written.get(job_id) == payload:
                     return
-                job_data = self.jobs[job_id].copy()
 
-            job_dir = self.jobs_dir / job_id
-            job_dir.mkdir(parents=True, exist_ok=True)
+                job_dir = os.path.join(self._jobs_root, job_id)
+                if job_id not in self._made_dirs:
+                    os.makedirs(job_dir, exist_ok=True)
+                    self._made_dirs.add(job_id)
+
+                _write_atomic(os.path.join(job_dir, 'metadata.json'), payload)
+                self._last_written[job_id] = payload
 
-            metadata_file = job_dir / 'metadata.json'
-            with open(metadata_file, 'w') as f:
-                json.dump(job_data, f, indent=2)
+            # Finished jobs are what the index holds; refresh it on the next flush
+            if finished:
+                self._index_dirty = True
+                self._flush_wanted.set()
 
         except Exception as e:
+            # Re-check the directory next time (it may have been removed externally)
+            self._made_dirs.discard(job_id)
             logger.error(f"Error saving metadata for job {job_id}: {str(e)}")
 
+    async def _save_job_metadata_async(self, job_id: str) -> None:
+        """Save job metadata on a worker thread, keeping the event loop free"""
+        await asyncio.to_thread(self._save_job_metadata, job_id)
+
+    def _save_now(self, job_id: str) -> None:
+        """
+        Write a job's metadata immediately
+
+        Called from the event loop thread (the async job tasks and API handlers),
+        the write is handed to a worker thread so the loop never blocks on disk;
+        from any other thread it is written inline.
+
+        Args:
+            job_id: Job identifier
+        """
+        loop = self.event_loop
+        if loop is None or not self._on_loop(loop):
+            self._save_job_metadata(job_id)
+            return
+
+        # Also queue it for the flusher, so close() still writes it if shutdown
+        # comes before the worker thread runs
+        self._dirty.add(job_id)
+        task = loop.create_task(self._save_job_metadata_async(job_id))
+        self._save_tasks.add(task)
+        task.add_done_callback(self._save_tasks.discard)
+
+    @staticmethod
+    def _on_loop(loop: asyncio.AbstractEventLoop) -> bool:
+        """Whether the calling thread is running the given event loop"""
+        try:
+            return asyncio.get_running_loop() is loop
+        except RuntimeError:
+            return False
+
+    def _mark_dirty(self, job_id: str) -> None:
+        """Queue a job's metadata for the next debounced flush"""
+        self._dirty.add(job_id)
+        self._flush_wanted.set()
+
+    def _flush_loop(self) -> None:
+        """
+        Background thread: persist dirty jobs, debounced
+
+        Sleeps until a job is marked dirty, waits _flush_delay so a burst of
+        updates collapses into one write per job, then writes. No wake-ups
+        while idle.
+        """
+        while True:
+            self._flush_wanted.wait()
+            if self._stop_flusher.wait(self._flush_delay):
+                return
+            # Clear before draining: anything marked dirty after this re-arms the event
+            self._flush_wanted.clear()
+            self.flush()
+
+    def flush(self) -> None:
+        """Write all jobs with unsaved progress to disk, then the index if it changed"""
+        dirty = list(self._dirty)  # Atomic snapshot under the GIL
+
+        for job_id in dirty:
+            self._save_job_metadata(job_id)
+
+        if self._index_dirty:
+            self._write_index()
+
+    def close(self) -> None:
+        """Stop the background flusher and write any unsaved progress"""
+        self._stop_flusher.set()
+        self._flush_wanted.set()
+        self._flusher.join(timeout=2.0)
+        self.flush()
+
     def delete_job(self, job_id: str) -> bool:
         """
         Delete job and all associated files
@@ -302,29 +701,39 @@ class JobManager:
             self.request_cancellation(job_id)
 
             # Cancel the task if it exists
-            with self.lock:
+            with self._task_lock:
                 if job_id in self.job_tasks:
                     task = self.job_tasks[job_id]
                     if not task.done():
                         task.cancel()
                     del self.job_tasks[job_id]
 
-                # Remove cancellation event
-                if job_id in self.cancellation_events:
-                    del self.cancellation_events[job_id]
-
-                # Remove pending writes tracking
-                if job_id in self._pending_writes:
-                    del self._pending_writes[job_id]
+            with self.lock:
+                # Drop unsaved progress (the job directory is removed below)
+                self._dirty.discard(job_id)
 
                 # Remove from memory
                 if job_id in self.jobs:
+                    self._status_counts[self.jobs[job_id]['status']] -= 1
                     del self.jobs[job_id]
+                self._job_locks.pop(job_id, None)
 
-            # Remove from disk
+            # Remove cancellation event only now: with the job gone too,
+            # is_cancelled keeps reporting True for it
+            with self._task_lock:
+                self.cancellation_events.pop(job_id, None)
+
+            # Remove from disk (after any in-flight metadata write for this job)
             job_dir = self.jobs_dir / job_id
-            if job_dir.exists():
-                shutil.rmtree(job_dir)
+            with self._write_lock:
+                self._last_written.pop(job_id, None)
+                self._index_entries.pop(job_id, None)
+                self._made_dirs.discard(job_id)
+                if job_dir.exists():
+                    shutil.rmtree(job_dir)
+
+            self._index_dirty = True
+            self._flush_wanted.set()
 
             logger.info(f"Deleted job {job_id}")
             return True
@@ -337,23 +746,27 @@ class JobManager:
 
     def add_ws_connection(self, job_id: str, websocket):
         """Register a WebSocket connection for a job"""
-        with self.lock:
-            if job_id not in self.ws_connections:
-                self.ws_connections[job_id] = []
-            self.ws_connections[job_id].append(websocket)
+        with self._ws_lock:
+            connections = self.ws_connections.setdefault(job_id, set())
+            if websocket not in connections:
+                connections.add(websocket)
+                self._ws_count += 1
 
         logger.info(f"WebSocket added for job {job_id}")
 
     def remove_ws_connection(self, job_id: str, websocket):
         """Unregister a WebSocket connection"""
-        with self.lock:
-            if job_id in self.ws_connections:
-                if websocket in self.ws_connections[job_id]:
-                    self.ws_connections[job_id].remove(websocket)
-
-                # Clean up empty lists
-                if not self.ws_connections[job_id]:
+        with self._ws_lock:
+            connections = self.ws_connections.get(job_id)
+            if connections is not None:
+                if websocket in connections:
+                    connections.remove(websocket)
+                    self._ws_count -= 1
+
+                # Clean up empty sets
+                if not connections:
                     del self.ws_connections[job_id]
+                    self._last_broadcast.pop(job_id, None)
 
         logger.info(f"WebSocket removed for job {job_id}")
 
@@ -362,57 +775,136 @@ class JobManager:
         Schedule a broadcast to all WebSocket clients for a job
         Safely handles being called from worker threads
         """
+        # Nobody is watching this job (the common case): skip the cross-thread
+        # hand-off entirely. Lock-free dict read; a client that connects later
+        # is sent the current status on connect.
+        if not self.ws_connections.get(job_id):
+            return
+
         if not self.event_loop:
             logger.warning(f"Event loop not set, cannot broadcast for job {job_id}")
             return
 
+        # Already queued: the pending broadcast reads the job state when it is sent,
+        # so it will carry this update too
+        if job_id in self._broadcast_pending:
+            return
+
         try:
-            # Always use run_coroutine_threadsafe with the saved event loop
-            # This is safe whether called from async context or worker thread
-            asyncio.run_coroutine_threadsafe(
-                self._broadcast_progress(job_id),
-                self.event_loop
-            )
-        except Exception as e:
+            # Hand off to the saved loop; safe from async context or worker threads
+            self.event_loop.call_soon_threadsafe(self._queue_broadcast, job_id)
+        except RuntimeError as e:
+            # Loop already closed (shutdown)
             logger.error(f"Error scheduling broadcast for job {job_id}: {str(e)}")
 
-    async def _broadcast_progress(self, job_id: str):
-        """Broadcast progress update to all WebSocket clients"""
+    def _queue_broadcast(self, job_id: str) -> None:
+        """Runs on the event loop: queue a job for the broadcaster task (started on first use)"""
+        if self._broadcaster is None or self._broadcaster.done():
+            self._broadcast_wanted = asyncio.Event()
+            self._broadcaster = self.event_loop.create_task(self._broadcast_loop())
+        self._broadcast_pending.add(job_id)
+        self._broadcast_wanted.set()
+
+    async def _broadcast_loop(self) -> None:
+        """
+        Send queued job updates, corked
+
+        Waits _broadcast_delay after the first queued update so rapid progress
+        ticks collapse into one message per job carrying the latest state.
+        """
+        while True:
+            await self._broadcast_wanted.wait()
+            await asyncio.sleep(self._broadcast_delay)
+            self._broadcast_wanted.clear()
+
+            job_ids, self._broadcast_pending = self._broadcast_pending, set()
+            await asyncio.gather(
+                *(self._broadcast_progress(job_id) for job_id in job_ids),
+                return_exceptions=True
+            )
+
+    def status_message(self, job_id: str) -> Optional[str]:
+        """
+        Encode a job's WebSocket status message (orjson when available)
+
+        Returns:
+            JSON text with status, progress and error, or None if the job doesn't exist
+        """
         job = self.get_job(job_id)
         if not job:
-            return
+            return None
 
-        message = {
+        return _dumps({
             'status': job['status'],
             'progress': job.get('progress'),
             'error': job.get('error')
-        }
+        }).decode()
+
+    async def _broadcast_progress(self, job_id: str):
+        """Broadcast progress update to all WebSocket clients"""
+        job = self.get_job(job_id)
+        if not job:
+            return
+
+        # Skip updates clients already have (e.g. a re-sent stage with only a
+        # new timestamp); updated_at alone is not worth a message
+        progress = job.get('progress') or {}
+        content = (
+            job['status'], job.get('error'),
+            progress.get('stage'), progress.get('message'), progress.get('progress')
+        )
+        if self._last_broadcast.get(job_id) == content:
+            return
 
         # Get connections to broadcast to
-        with self.lock:
-            connections = self.ws_connections.get(job_id, []).copy()
-
-        # Broadcast to all connections
-        for ws in connections:
-            try:
-                await ws.send_json(message)
-            except Exception as e:
-                logger.error(f"Error broadcasting to WebSocket: {str(e)}")
+        with self._ws_lock:
+            connections = list(self.ws_connections.get(job_id, ()))
+
+        if not connections:
+            return
+
+        self._last_broadcast[job_id] = content
+        payload = self.status_message(job_id)
+        if payload is None:
+            return
+
+        # Serialized once, sent to all connections concurrently. Sent as a text
+        # frame (like send_json) so clients keep parsing event.data as JSON.
+        # Each send is bounded, so one stalled client can't hold up the broadcast.
+        results = await asyncio.gather(
+            *(asyncio.wait_for(ws.send_text(payload), self._send_timeout) for ws in connections),
+            return_exceptions=True
+        )
+
+        for ws, result in zip(connections, results):
+            if isinstance(result, asyncio.TimeoutError):
+                logger.warning(f"WebSocket for job {job_id} too slow, disconnecting")
+                self.remove_ws_connection(job_id, ws)
+                # Closing ends the endpoint's receive loop; don't wait on the slow client
+                task = asyncio.ensure_future(self._close_quietly(ws))
+                self._close_tasks.add(task)
+                task.add_done_callback(self._close_tasks.discard)
+            elif isinstance(result, Exception):
+                logger.error(f"Error broadcasting to WebSocket: {str(result)}")
                 # Remove dead connections
                 self.remove_ws_connection(job_id, ws)
 
+    async def _close_quietly(self, websocket) -> None:
+        """Close a WebSocket dropped for being too slow, ignoring errors"""
+        try:
+            await asyncio.wait_for(websocket.close(), self._send_timeout)
+        except Exception:
+            pass
+
     def get_stats(self) -> dict:
         """Get statistics about jobs"""
+        # Counters are maintained on create/status change/delete; no scan needed
         with self.lock:
             total = len(self.jobs)
-            by_status = {}
-
-            for job in self.jobs.values():
-                status = job['status']
-                by_status[status] = by_status.get(status, 0) + 1
+            by_status = {status: count for status, count in self._status_counts.items() if count}
 
         return {
             'total_jobs': total,
             'by_status': by_status,
-            'active_ws_connections': sum(len(conns) for conns in self.ws_connections.values())
+            'active_ws_connections': self._ws_count
         }
@@ -13,23 +13,53 @@ from dotenv import load_dotenv
 # PYTORCH_CUDA_ALLOC_CONF must be set before PyTorch initialization
 load_dotenv()
 
-# Apply PyTorch memory optimization if not already set
-if 'PYTORCH_CUDA_ALLOC_CONF' not in os.environ:
-    os.environ['PYTORCH_CUDA_ALLOC_CONF'] = 'expandable_segments:True'
-
+# Apply PyTorch allocator tuning, keeping any keys the user already set:
+# - expandable_segments: grow segments in place instead of cudaFree/cudaMalloc
+#   churn when resolution changes between jobs or models are swapped
+# - garbage_collection_threshold: reclaim cached blocks once 80% is in use,
+#   before an allocation fails, rather than OOM-ing on the second job
+# - pinned_use_cuda_host_register: faster pinned host buffers for H2D copies
+# The first two only apply to the native allocator (not backend:cudaMallocAsync)
+_alloc_conf = dict(
+    item.split(':', 1) for item in os.getenv('PYTORCH_CUDA_ALLOC_CONF', '').split(',') if ':' in item
+)
+if _alloc_conf.get('backend', 'native') == 'native':
+    _alloc_conf.setdefault('expandable_segments', 'True')
+    _alloc_conf.setdefault('garbage_collection_threshold', '0.8')
+_alloc_conf.setdefault('pinned_use_cuda_host_register', 'True')
+os.environ['PYTORCH_CUDA_ALLOC_CONF'] = ','.join(f"{key}:{value}" for key, value in _alloc_conf.items())
+
+import gc
+import time
+import errno
+import struct
+import shutil
 import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial, lru_cache
 from contextlib import asynccontextmanager
-from typing import Optional, Dict, Any, List
+from dataclasses import dataclass
+from typing import Callable, Optional, Dict, Any, List, Tuple
 from pathlib import Path
 from io import BytesIO
 
 from fastapi import FastAPI, UploadFile, File, Form, HTTPException, WebSocket, WebSocketDisconnect, BackgroundTasks, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.responses import FileResponse, JSONResponse, ORJSONResponse, Response
 import json
 import logging
+import torch
 from PIL import Image
 
+try:
+    import orjson
+except ImportError:  # orjson is optional; API responses fall back to stdlib json
+    orjson = None
+
+# Response class for JSON endpoints. Handlers with large plain-dict payloads
+# return it directly, which also skips FastAPI's jsonable_encoder pass
+APIResponse = ORJSONResponse if orjson is not None else JSONResponse
+
 from image_editor import ImageEditor
 from job_manager import JobManager, JobStatus
 from models import EditConfig, JobStatusResponse, ProgressInfo, ModelType
@@ -51,33 +81,139 @@ os.environ['HF_HOME'] = os.getenv('HF_HOME', '/workspace/huggingface_cache')
 os.environ['TRANSFORMERS_CACHE'] = os.getenv('TRANSFORMERS_CACHE', '/workspace/huggingface_cache')
 os.environ['HF_DATASETS_CACHE'] = os.getenv('HF_DATASETS_CACHE', '/workspace/huggingface_cache')
 
+
+@dataclass(frozen=True)
+class Settings:
+    """
+    Server configuration, read from the environment once at startup
+
+    Attributes:
+        jobs_dir: Job inputs, outputs and metadata
+        input_folder: Folder browsed for input images
+        output_folder: Folder finished outputs are copied to
+        host: Listen address
+        port: Listen port
+        development: Allow any CORS origin (ENV=development)
+        allowed_origins: CORS origins outside development (plus RunPod proxies)
+        torch_compile: True/False to force torch.compile, None = CUDA only ('auto')
+        preload_model: GGUF quantization level to load at startup; empty disables preloading
+        replicate_workers: Threads for blocking Replicate API calls (network-bound, run concurrently)
+    """
+    jobs_dir: Path
+    input_folder: Path
+    output_folder: Path
+    host: str
+    port: int
+    development: bool
+    allowed_origins: Tuple[str, ...]
+    torch_compile: Optional[bool]
+    preload_model: str
+    replicate_workers: int
+
+
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    """
+    Parse the environment into Settings (cached; the environment is read once)
+
+    Returns:
+        Settings snapshot
+    """
+    allowed_origins = [
+        origin.strip()
+        for origin in os.getenv('ALLOWED_ORIGINS', 'http://localhost:3000,http://localhost:5173').split(',')
+        if origin.strip()
+    ]
+    # Add RunPod proxy domains if running on RunPod
+    pod_id = os.getenv('RUNPOD_POD_ID')
+    if pod_id:
+        allowed_origins += [
+            f"https://{pod_id}-3000.proxy.runpod.net",
+            f"https://{pod_id}-5173.proxy.runpod.net"
+        ]
+
+    return Settings(
+        jobs_dir=Path(os.getenv('JOBS_DIR', '/workspace/jobs')),
+        input_folder=Path(os.getenv('INPUT_FOLDER', '~/input')).expanduser(),
+        output_folder=Path(os.getenv('OUTPUT_FOLDER', '~/output')).expanduser(),
+        host=os.getenv('HOST', '0.0.0.0'),
+        port=int(os.getenv('PORT', '8000')),
+        development=os.getenv('ENV', 'development') == 'development',
+        allowed_origins=tuple(allowed_origins),
+        torch_compile={'true': True, 'false': False}.get(os.getenv('TORCH_COMPILE', 'auto').lower()),
+        preload_model=os.getenv('PRELOAD_MODEL', '').strip(),
+        replicate_workers=max(1, int(os.getenv('REPLICATE_WORKERS', '4')))
+    )
+
+
 # Configuration
-JOBS_DIR = Path(os.getenv('JOBS_DIR', '/workspace/jobs'))
-INPUT_FOLDER = Path(os.path.expanduser(os.getenv('INPUT_FOLDER', '~/input')))
-OUTPUT_FOLDER = Path(os.path.expanduser(os.getenv('OUTPUT_FOLDER', '~/output')))
-HOST = os.getenv('HOST', '0.0.0.0')
-PORT = int(os.getenv('PORT', '8000'))
+settings = get_settings()
+JOBS_DIR = settings.jobs_dir
+INPUT_FOLDER = settings.input_folder
+OUTPUT_FOLDER = settings.output_folder
 MAX_FILE_SIZE = 100 * 1024 * 1024  # 100MB limit
-ALLOWED_ORIGINS = os.getenv('ALLOWED_ORIGINS', 'http://localhost:3000,http://localhost:5173').split(',')
+TORCH_COMPILE = settings.torch_compile
+PRELOAD_MODEL = settings.preload_model
+REPLICATE_WORKERS = settings.replicate_workers
 
 # Global instances
 job_manager = JobManager(JOBS_DIR)
 image_editor: Optional[ImageEditor] = None  # Standard Qwen model
 image_editor_gguf: Optional[ImageEditor] = None  # GGUF quantized model
 replicate_client: Optional[ReplicateClient] = None
-job_queue: asyncio.Queue = asyncio.Queue(maxsize=10)  # Limit concurrent jobs
-active_job_semaphore: asyncio.Semaphore = asyncio.Semaphore(1)  # Only 1 job at a time on GPU
 executor_futures: Dict[str, Any] = {}  # Track futures for cleanup
-
-
-def copy_outputs_to_folder(job_id: str, output_images: List[str]) -> None:
+# Local model loads and inference run on one dedicated thread, in submission order;
+# Replicate calls get their own pool so they never queue behind (or starve) the GPU.
+# Both are created per lifespan, since shutdown leaves an executor unusable
+gpu_executor: Optional[ThreadPoolExecutor] = None
+net_executor: Optional[ThreadPoolExecutor] = None
+# Jobs allowed to run at once per model: one on the GPU, and up to REPLICATE_WORKERS
+# per cloud model so a burst of one model can't flood Replicate (or starve the others)
+MODEL_CONCURRENCY: Dict[ModelType, int] = {
+    model_type: 1 if model_type == ModelType.QWEN_GGUF else REPLICATE_WORKERS
+    for model_type in ModelType
+}
+model_semaphores: Dict[ModelType, asyncio.Semaphore] = {
+    model_type: asyncio.Semaphore(limit) for model_type, limit in MODEL_CONCURRENCY.items()
+}
+
+
+# Cleared after the first cross-device os.link failure (JOBS_DIR and OUTPUT_FOLDER
+# on different filesystems), so later copies go straight to shutil.copy2
+_hardlink_outputs = True
+
+
+def _link_or_copy(source: Path, dest: Path) -> None:
     """
-    Copy output images to the default output folder (~/output)
+    Place source at dest, as a hard link when possible
 
-    Args:
-        job_id: Job identifier
-        output_images: List of output image filenames
+    A hard link is one syscall regardless of file size. Across filesystems this
+    falls back to shutil.copy2, which uses the kernel's zero-copy path where
+    available (sendfile on Linux, fcopyfile on macOS).
     """
+    global _hardlink_outputs
+
+    try:
+        os.unlink(dest)  # Replace an earlier copy, like copy2 would
+    except FileNotFoundError:
+        pass
+
+    if _hardlink_outputs:
+        try:
+            os.link(source, dest)
+            return
+        except OSError as e:
+            if e.errno in (errno.EXDEV, errno.EPERM, errno.ENOTSUP, errno.EOPNOTSUPP):
+                _hardlink_outputs = False
+                logger.info(f"Hard links unavailable for output folder ({e.strerror}); copying instead")
+            else:
+                raise
+
+    shutil.copy2(source, dest)
+
+
+def _copy_outputs(job_id: str, output_images: List[str]) -> None:
+    """Blocking part of copy_outputs_to_folder (runs on a worker thread)"""
     try:
         job_dir = JOBS_DIR / job_id
 
@@ -88,8 +224,7 @@ def copy_outputs_to_folder(job_id: str, output_images: List[str]) -> None:
                 dest_filename = f"{job_id}_{filename}"
                 dest = OUTPUT_FOLDER / dest_filename
 
-                import shutil
-                shutil.copy2(source, dest)
+                _link_or_copy(source, dest)
                 logger.info(f"Copied {filename} to output folder as {dest_filename}")
 
     except Exception as e:
@@ -97,244 +232,299 @@ def copy_outputs_to_folder(job_id: str, output_images: List[str]) -> None:
         # Non-critical, don't raise
 
 
-async def validate_image_file(file: UploadFile, max_size: int = MAX_FILE_SIZE) -> bytes:
+async def copy_outputs_to_folder(job_id: str, output_images: List[str]) -> None:
     """
-    Validate image file format and size
+    Copy output images to the default output folder (~/output)
 
-    Args:
-        file: Uploaded file
-        max_size: Maximum allowed file size in bytes
+    The file work runs on a worker thread so the event loop isn't blocked.
 
-    Returns:
-        File content as bytes
-
-    Raises:
-        HTTPException: If validation fails
+    Args:
+        job_id: Job identifier
+        output_images: List of output image filenames
     """
-    # Read file content
-    content = await file.read()
+    await asyncio.to_thread(_copy_outputs, job_id, output_images)
 
-    # Check file size
-    if len(content) > max_size:
-        raise HTTPException(
-            status_code=413,
-            detail=f"File too large. Maximum size is {max_size // (1024*1024)}MB"
-        )
 
-    # Validate actual image format using PIL
-    try:
-        img = Image.open(BytesIO(content))
-        image_format = img.format.lower() if img.format else None
-
-        # Verify image can be loaded
-        img.verify()
-
-        # Check format is supported
-        allowed_formats = ['jpeg', 'png', 'webp', 'bmp', 'jpg']
-        if image_format not in allowed_formats:
-            raise HTTPException(
-                status_code=400,
-                detail=f"Invalid image format. Allowed: JPEG, PNG, WebP, BMP. Detected: {image_format or 'unknown'}"
-            )
-    except Exception as e:
-        if isinstance(e, HTTPException):
-            raise
-        raise HTTPException(
-            status_code=400,
-            detail=f"Invalid or corrupted image file: {str(e)}"
-        )
-
-    return content
+def _list_inputs(job_dir: Path, max_inputs: int) -> List[str]:
+    """
+    List a job's input images (input_1.jpg ... input_N.jpg) in order
 
+    One directory scan instead of an exists() probe per slot, which matters on
+    network-mounted volumes where each stat is a round-trip.
 
-async def generate_image_qwen_cloud(job_id: str) -> None:
-    """Execute simple image editing using qwen/qwen-image-edit"""
-    global replicate_client
+    Args:
+        job_dir: Job directory
+        max_inputs: Highest input slot the model accepts
 
+    Returns:
+        Paths of the inputs present, in slot order
+    """
     try:
-        if replicate_client is None:
-            logger.info("Initializing Replicate client...")
-            replicate_client = ReplicateClient()
-
-        if job_manager.is_cancelled(job_id):
-            return
-
-        job = job_manager.get_job(job_id)
-        if not job:
-            raise Exception(f"Job {job_id} not found")
+        with os.scandir(job_dir) as it:
+            names = {entry.name for entry in it}
+    except FileNotFoundError:
+        return []
+
+    return [
+        os.path.join(job_dir, f'input_{i}.jpg')
+        for i in range(1, max_inputs + 1)
+        if f'input_{i}.jpg' in names
+    ]
+
+
+# Leading bytes of the accepted upload formats (WebP is a RIFF container, checked below)
+IMAGE_SIGNATURES = {
+    b'\xff\xd8\xff': 'jpeg',
+    b'\x89PNG\r\n\x1a\n': 'png',
+    b'BM': 'bmp',
+}
+UPLOAD_CHUNK_SIZE = 64 * 1024
+# Formats accepted for upload (as reported by the sniffer or PIL)
+ALLOWED_IMAGE_FORMATS = frozenset({'jpeg', 'png', 'webp', 'bmp', 'jpg'})
+# Image files served from and listed in the input folder, by extension
+IMAGE_MEDIA_TYPES = {
+    '.jpg': 'image/jpeg',
+    '.jpeg': 'image/jpeg',
+    '.png': 'image/png',
+    '.webp': 'image/webp',
+    '.bmp': 'image/bmp'
+}
+IMAGE_EXTENSIONS = frozenset(IMAGE_MEDIA_TYPES)
+# Accepted upload dimensions (pixels per side)
+MIN_IMAGE_SIDE = 32
+MAX_IMAGE_SIDE = 8192
+
+
+def sniff_image_format(header: bytes) -> Optional[str]:
+    """
+    Identify an image format from its first bytes
 
-        config = EditConfig(**job['config'])
-        job_dir = JOBS_DIR / job_id
+    Args:
+        header: Start of the file (at least 12 bytes for WebP)
 
-        input_paths = []
-        if (job_dir / 'input_1.jpg').exists():
-            input_paths.append(str(job_dir / 'input_1.jpg'))
+    Returns:
+        Format name (jpeg, png, webp, bmp), or None if not recognized
+    """
+    if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+        return 'webp'
+    for signature, image_format in IMAGE_SIGNATURES.items():
+        if header.startswith(signature):
+            return image_format
+    return None
 
-        if not input_paths:
-            raise Exception("No input images found")
 
-        def progress_callback(stage: str, message: str, progress: int = 0):
-            if job_manager.is_cancelled(job_id):
-                raise asyncio.CancelledError("Job cancelled by user")
-            job_manager.update_progress(job_id, stage=stage, message=message, progress=progress)
+def _header_image_size(header: bytes) -> Optional[Tuple[int, int]]:
+    """
+    Parse width and height out of the first bytes of a JPEG/PNG/WebP/BMP file
 
-        progress_callback("preparing", "Starting Qwen-Image-Edit cloud...", 5)
+    Args:
+        header: Start of the file (JPEG size markers can sit after EXIF data)
 
-        loop = asyncio.get_event_loop()
-        future = loop.run_in_executor(
-            None,
-            replicate_client.edit_image_qwen_cloud,
-            input_paths,
-            config.prompt,
-            config.output_quality,
-            config.output_format,
-            config.disable_safety_checker,
-            job_dir,
-            progress_callback,
-            lambda: job_manager.is_cancelled(job_id)
-        )
-        executor_futures[job_id] = future
+    Returns:
+        (width, height), or None if the header isn't understood
+    """
+    image_format = sniff_image_format(header[:12])
+
+    if image_format == 'png':
+        if header[12:16] == b'IHDR':
+            return struct.unpack('>II', header[16:24])
+
+    elif image_format == 'jpeg':
+        # Walk the marker segments up to the first start-of-frame
+        i = 2
+        while i + 9 <= len(header):
+            if header[i] != 0xFF:
+                return None
+            marker = header[i + 1]
+            if marker == 0xFF:
+                i += 1
+                continue
+            if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+                height, width = struct.unpack('>HH', header[i + 5:i + 9])
+                return width, height
+            i += 2 + struct.unpack('>H', header[i + 2:i + 4])[0]
+
+    elif image_format == 'webp' and len(header) >= 30:
+        chunk = header[12:16]
+        if chunk == b'VP8 ':
+            width, height = struct.unpack('<HH', header[26:30])
+            return width & 0x3FFF, height & 0x3FFF
+        if chunk == b'VP8L':
+            bits = struct.unpack('<I', header[21:25])[0]
+            return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+        if chunk == b'VP8X':
+            return int.from_bytes(header[24:27], 'little') + 1, int.from_bytes(header[27:30], 'little') + 1
+
+    elif image_format == 'bmp' and len(header) >= 26:
+        if struct.unpack('<I', header[14:18])[0] == 12:  # OS/2 BITMAPCOREHEADER
+            return struct.unpack('<HH', header[18:22])
+        width, height = struct.unpack('<ii', header[18:26])
+        return width, abs(height)  # negative height = top-down rows
+
+    return None
+
+
+def read_image_size(path: str) -> Optional[Tuple[int, int]]:
+    """
+    Read an image file's dimensions without decoding it
 
-        try:
-            output_paths = await future
-        finally:
-            if job_id in executor_futures:
-                del executor_futures[job_id]
+    Common formats are parsed from the first 64KB; anything else falls back
+    to a header-only PIL open (closed again straight away).
 
-        if job_manager.is_cancelled(job_id):
-            return
+    Args:
+        path: Image file path
 
-        output_filenames = [Path(p).name for p in output_paths]
-        job_manager.update_job_data(job_id, {
-            'cost': QWEN_IMAGE_EDIT_PRICE,
-            'images_generated': len(output_paths),
-            'output_images': output_filenames
-        })
+    Returns:
+        (width, height), or None if the file isn't a readable image
+    """
+    try:
+        with open(path, 'rb') as f:
+            size = _header_image_size(f.read(64 * 1024))
+        if size is not None:
+            return size
+        with Image.open(path) as img:
+            return img.size
+    except Exception:
+        return None
 
-        # Copy outputs to ~/output folder
-        copy_outputs_to_folder(job_id, output_filenames)
 
-        job_manager.set_status(job_id, JobStatus.COMPLETE)
-        progress_callback("complete", f"Qwen-Image-Edit complete! Cost: ${QWEN_IMAGE_EDIT_PRICE:.3f}", 100)
-        logger.info(f"Job {job_id} completed with qwen/qwen-image-edit")
+def warm_image_codecs() -> float:
+    """
+    Register PIL's format plugins and exercise the JPEG/PNG codecs once
 
-    except asyncio.CancelledError:
-        job_manager.set_status(job_id, JobStatus.ERROR, error="Job cancelled by user")
-    except Exception as e:
-        logger.error(f"Error in Qwen-Image-Edit for job {job_id}: {str(e)}", exc_info=True)
-        job_manager.set_status(job_id, JobStatus.ERROR, error=str(e))
+    PIL registers most plugins lazily on the first open of an unrecognized
+    file, so without this the first request that touches PIL pays for it.
 
+    Returns:
+        Seconds taken
+    """
+    start = time.perf_counter()
+    Image.init()
+    for image_format in ('JPEG', 'PNG'):
+        buffer = BytesIO()
+        Image.new('RGB', (8, 8)).save(buffer, format=image_format)
+        buffer.seek(0)
+        with Image.open(buffer) as img:
+            img.load()
+    return time.perf_counter() - start
 
-async def generate_image_qwen_plus(job_id: str) -> None:
-    """Execute advanced editing using qwen/qwen-image-edit-plus"""
-    global replicate_client
 
-    try:
-        if replicate_client is None:
-            replicate_client = ReplicateClient()
+async def validate_image_file(file: UploadFile, max_size: int = MAX_FILE_SIZE) -> bytes:
+    """
+    Validate image file format and size
 
-        if job_manager.is_cancelled(job_id):
-            return
+    The upload is read in chunks and rejected as soon as it exceeds max_size;
+    the format and dimensions are read from the file header without decoding
+    any pixels.
 
-        job = job_manager.get_job(job_id)
-        if not job:
-            raise Exception(f"Job {job_id} not found")
+    Args:
+        file: Uploaded file
+        max_size: Maximum allowed file size in bytes
 
-        config = EditConfig(**job['config'])
-        job_dir = JOBS_DIR / job_id
+    Returns:
+        File content as bytes
 
-        input_paths = []
-        for i in range(1, 4):  # Support 1-3 images per API spec
-            path = job_dir / f'input_{i}.jpg'
-            if path.exists():
-                input_paths.append(str(path))
-
-        if not input_paths:
-            raise Exception("No input images found")
-
-        def progress_callback(stage: str, message: str, progress: int = 0):
-            if job_manager.is_cancelled(job_id):
-                raise asyncio.CancelledError("Job cancelled by user")
-            job_manager.update_progress(job_id, stage=stage, message=message, progress=progress)
-
-        progress_callback("preparing", "Starting Qwen-Image-Edit-Plus...", 5)
-
-        loop = asyncio.get_event_loop()
-        future = loop.run_in_executor(
-            None,
-            replicate_client.edit_image_qwen_plus,
-            input_paths,
-            config.prompt,
-            config.go_fast,
-            "match_input_image",  # ALWAYS match input for EDIT models
-            config.output_format,
-            config.output_quality,
-            config.disable_safety_checker,
-            job_dir,
-            progress_callback,
-            lambda: job_manager.is_cancelled(job_id)
+    Raises:
+        HTTPException: If validation fails
+    """
+    # Starlette records the spooled upload's size; reject without reading it back
+    if file.size is not None and file.size > max_size:
+        raise HTTPException(
+            status_code=413,
+            detail=f"File too large. Maximum size is {max_size // (1024*1024)}MB"
         )
-        executor_futures[job_id] = future
 
-        try:
-            output_paths = await future
-        finally:
-            if job_id in executor_futures:
-                del executor_futures[job_id]
-
-        if job_manager.is_cancelled(job_id):
-            return
-
-        output_filenames = [Path(p).name for p in output_paths]
-        job_manager.update_job_data(job_id, {
-            'cost': QWEN_IMAGE_EDIT_PLUS_PRICE,
-            'images_generated': len(output_paths),
-            'output_images': output_filenames
-        })
-
-        # Copy outputs to ~/output folder
-        copy_outputs_to_folder(job_id, output_filenames)
+    # Read file content, stopping early once it is too large
+    content = bytearray()
+    while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+        content += chunk
+        if len(content) > max_size:
+            raise HTTPException(
+                status_code=413,
+                detail=f"File too large. Maximum size is {max_size // (1024*1024)}MB"
+            )
 
-        job_manager.set_status(job_id, JobStatus.COMPLETE)
-        progress_callback("complete", f"Qwen-Image-Edit-Plus complete! Cost: ${QWEN_IMAGE_EDIT_PLUS_PRICE:.3f}", 100)
-        logger.info(f"Job {job_id} completed with qwen/qwen-image-edit-plus")
+    data = bytes(content)
+    image_format = sniff_image_format(data[:12])
 
-    except asyncio.CancelledError:
-        job_manager.set_status(job_id, JobStatus.ERROR, error="Job cancelled by user")
+    # Image.open only parses the header; pixels are decoded later by the model
+    try:
+        with Image.open(BytesIO(data)) as img:
+            if image_format is None:
+                image_format = img.format.lower() if img.format else None
+            width, height = img.size
     except Exception as e:
-        logger.error(f"Error in Qwen-Image-Edit-Plus for job {job_id}: {str(e)}", exc_info=True)
-        job_manager.set_status(job_id, JobStatus.ERROR, error=str(e))
-
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid or corrupted image file: {str(e)}"
+        )
 
-async def generate_image_qwen_text_to_image(job_id: str) -> None:
-    """Execute text-to-image generation using qwen/qwen-image"""
-    global replicate_client
+    # Check format is supported
+    if image_format not in ALLOWED_IMAGE_FORMATS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid image format. Allowed: JPEG, PNG, WebP, BMP. Detected: {image_format or 'unknown'}"
+        )
 
-    try:
-        if replicate_client is None:
-            replicate_client = ReplicateClient()
+    if min(width, height) < MIN_IMAGE_SIDE or max(width, height) > MAX_IMAGE_SIDE:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Image is {width}x{height}. Each side must be between {MIN_IMAGE_SIDE} and {MAX_IMAGE_SIDE} pixels"
+        )
 
-        if job_manager.is_cancelled(job_id):
-            return
+    return data
 
-        job = job_manager.get_job(job_id)
-        if not job:
-            raise Exception(f"Job {job_id} not found")
 
-        config = EditConfig(**job['config'])
-        job_dir = JOBS_DIR / job_id
+def make_progress_callback(job_id: str, is_cancelled: Callable[[], bool]) -> Callable[..., None]:
+    """
+    Build a job's progress callback, which also raises if the job was cancelled
 
-        def progress_callback(stage: str, message: str, progress: int = 0):
-            if job_manager.is_cancelled(job_id):
-                raise asyncio.CancelledError("Job cancelled by user")
-            job_manager.update_progress(job_id, stage=stage, message=message, progress=progress)
+    It runs on every inference step, so everything it touches is bound up front
+    (closure cells instead of global + attribute lookups per call).
 
-        progress_callback("preparing", "Starting Qwen-Image text-to-image...", 5)
+    Args:
+        job_id: Job identifier
+        is_cancelled: Cancellation checker from job_manager.cancellation_checker
 
-        loop = asyncio.get_event_loop()
-        future = loop.run_in_executor(
-            None,
-            replicate_client.generate_image_qwen,
+    Returns:
+        Callback taking (stage, message, progress)
+    """
+    update_progress = job_manager.update_progress
+    cancelled_error = asyncio.CancelledError
+
+    def progress_callback(stage: str, message: str, progress: int = 0):
+        if is_cancelled():
+            raise cancelled_error("Job cancelled by user")
+        update_progress(job_id, stage, message, progress)
+
+    return progress_callback
+
+
+# Replicate-backed models. Each entry says how to call its ReplicateClient method:
+# 'args' builds the positional arguments that come before the shared
+# (output_dir, progress_callback, is_cancelled) tail, from the config and the
+# job's input images; 'max_inputs' is the number of input slots read (0 for
+# text-to-image) and cost comes from ReplicateClient.calculate_cost.
+REPLICATE_MODELS: Dict[ModelType, Dict[str, Any]] = {
+    ModelType.HUNYUAN: {
+        'label': 'Hunyuan Image 3',
+        'method': 'generate_image_hunyuan',
+        'max_inputs': 0,
+        'args': lambda config, inputs: (
+            config.prompt,
+            config.aspect_ratio or "1:1",
+            config.go_fast,
+            config.seed,
+            config.output_format,
+            config.output_quality,
+            config.disable_safety_checker,
+        ),
+    },
+    ModelType.QWEN_IMAGE: {
+        'label': 'Qwen-Image',
+        'method': 'generate_image_qwen',
+        'max_inputs': 0,
+        'args': lambda config, inputs: (
             config.prompt,
             config.negative_prompt or " ",
             config.go_fast,
@@ -348,95 +538,14 @@ async def generate_image_qwen_text_to_image(job_id: str) -> None:
             config.output_quality,
             config.num_inference_steps,
             config.disable_safety_checker,
-            job_dir,
-            progress_callback,
-            lambda: job_manager.is_cancelled(job_id)
-        )
-        executor_futures[job_id] = future
-
-        try:
-            output_paths = await future
-        finally:
-            if job_id in executor_futures:
-                del executor_futures[job_id]
-
-        if job_manager.is_cancelled(job_id):
-            return
-
-        output_filenames = [Path(p).name for p in output_paths]
-        job_manager.update_job_data(job_id, {
-            'cost': QWEN_IMAGE_PRICE,
-            'images_generated': len(output_paths),
-            'output_images': output_filenames
-        })
-
-        # Copy outputs to ~/output folder
-        copy_outputs_to_folder(job_id, output_filenames)
-
-        job_manager.set_status(job_id, JobStatus.COMPLETE)
-        progress_callback("complete", f"Qwen-Image complete! Cost: ${QWEN_IMAGE_PRICE:.3f}", 100)
-        logger.info(f"Job {job_id} completed with qwen/qwen-image")
-
-    except asyncio.CancelledError:
-        job_manager.set_status(job_id, JobStatus.ERROR, error="Job cancelled by user")
-    except Exception as e:
-        logger.error(f"Error in Qwen-Image for job {job_id}: {str(e)}", exc_info=True)
-        job_manager.set_status(job_id, JobStatus.ERROR, error=str(e))
-
-
-async def generate_image_seedream(job_id: str) -> None:
-    """
-    Execute image generation using Seedream-4 via Replicate API
-    """
-    global replicate_client
-
-    try:
-        # Lazy load Replicate client
-        if replicate_client is None:
-            logger.info("Initializing Replicate client...")
-            replicate_client = ReplicateClient()
-
-        # Check for cancellation
-        if job_manager.is_cancelled(job_id):
-            logger.info(f"Job {job_id} was cancelled before starting")
-            return
-
-        # Get job metadata
-        job = job_manager.get_job(job_id)
-        if not job:
-            raise Exception(f"Job {job_id} not found")
-
-        config = EditConfig(**job['config'])
-        job_dir = JOBS_DIR / job_id
-
-        # Load input images
-        input_paths = []
-        if (job_dir / 'input_1.jpg').exists():
-            input_paths.append(str(job_dir / 'input_1.jpg'))
-        if (job_dir / 'input_2.jpg').exists():
-            input_paths.append(str(job_dir / 'input_2.jpg'))
-
-        if not input_paths:
-            raise Exception("No input images found")
-
-        # Progress callback
-        def progress_callback(stage: str, message: str, progress: int = 0):
-            if job_manager.is_cancelled(job_id):
-                raise asyncio.CancelledError("Job cancelled by user")
-            job_manager.update_progress(job_id, stage=stage, message=message, progress=progress)
-
-        progress_callback("preparing", "Starting Seedream-4 generation...", 5)
-
-        # Calculate cost
-        estimated_cost = replicate_client.calculate_cost("seedream", config.max_images)
-        logger.info(f"Estimated cost for job {job_id}: ${estimated_cost:.2f} ({config.max_images} images)")
-
-        # Run in executor to avoid blocking
-        loop = asyncio.get_event_loop()
-        future = loop.run_in_executor(
-            None,
-            replicate_client.edit_image,
-            input_paths,
+        ),
+    },
+    ModelType.SEEDREAM: {
+        'label': 'Seedream-4',
+        'method': 'edit_image',
+        'max_inputs': 2,
+        'args': lambda config, inputs: (
+            inputs,
             config.prompt,
             config.size,
             config.aspect_ratio,
@@ -444,148 +553,143 @@ async def generate_image_seedream(job_id: str) -> None:
             config.sequential_image_generation,
             config.max_images,
             config.disable_safety_checker,
-            job_dir,
-            progress_callback,
-            lambda: job_manager.is_cancelled(job_id)
-        )
-        executor_futures[job_id] = future
-
-        try:
-            output_paths = await future
-        finally:
-            if job_id in executor_futures:
-                del executor_futures[job_id]
-
-        # Check cancellation
-        if job_manager.is_cancelled(job_id):
-            logger.info(f"Job {job_id} cancelled after generation")
-            return
-
-        # Calculate actual cost based on output images
-        actual_cost = replicate_client.calculate_cost("seedream", len(output_paths))
-
-        # Get relative paths for output images
-        output_filenames = [Path(p).name for p in output_paths]
-
-        # Update job with cost info and output images list
-        job_manager.update_job_data(job_id, {
-            'cost': actual_cost,
-            'images_generated': len(output_paths),
-            'output_images': output_filenames
-        })
-
-        # Copy outputs to ~/output folder
-        copy_outputs_to_folder(job_id, output_filenames)
-
-        # Mark as complete
-        job_manager.set_status(job_id, JobStatus.COMPLETE)
-        progress_callback("complete", f"Seedream-4 complete! Generated {len(output_paths)} image(s). Cost: ${actual_cost:.2f}", 100)
-        logger.info(f"Job {job_id} completed successfully. Generated {len(output_paths)} images. Cost: ${actual_cost:.2f}")
-
-    except asyncio.CancelledError:
-        logger.info(f"Job {job_id} was cancelled")
-        job_manager.set_status(job_id, JobStatus.ERROR, error="Job cancelled by user")
-    except Exception as e:
-        logger.error(f"Error in Seedream generation for job {job_id}: {str(e)}", exc_info=True)
-        job_manager.set_status(job_id, JobStatus.ERROR, error=str(e))
+        ),
+        # Retry delays wait on the cancellation event
+        'cancel_event': True,
+    },
+    ModelType.QWEN_IMAGE_EDIT: {
+        'label': 'Qwen-Image-Edit',
+        'method': 'edit_image_qwen_cloud',
+        'max_inputs': 1,
+        'args': lambda config, inputs: (
+            inputs,
+            config.prompt,
+            config.output_quality,
+            config.output_format,
+            config.disable_safety_checker,
+        ),
+    },
+    ModelType.QWEN_IMAGE_EDIT_PLUS: {
+        'label': 'Qwen-Image-Edit-Plus',
+        'method': 'edit_image_qwen_plus',
+        'max_inputs': 3,  # Support 1-3 images per API spec
+        'args': lambda config, inputs: (
+            inputs,
+            config.prompt,
+            config.go_fast,
+            "match_input_image",  # ALWAYS match input for EDIT models
+            config.output_format,
+            config.output_quality,
+            config.disable_safety_checker,
+        ),
+    },
+}
 
 
-async def generate_image_hunyuan(job_id: str) -> None:
+async def run_replicate_job(job_id: str, config: EditConfig, job_dir: Path) -> None:
     """
-    Execute image generation using Hunyuan Image 3 via Replicate API
+    Execute a job on a Replicate-backed model (see REPLICATE_MODELS)
+
+    Args:
+        job_id: Job identifier
+        config: Validated job configuration
+        job_dir: Job directory (inputs are read from and outputs written to it)
     """
     global replicate_client
 
+    spec = REPLICATE_MODELS[config.model_type]
+    label = spec['label']
+
     try:
         # Lazy load Replicate client
         if replicate_client is None:
             logger.info("Initializing Replicate client...")
             replicate_client = ReplicateClient()
 
+        # One checker per job, shared by the callbacks below and the worker thread
+        is_cancelled = job_manager.cancellation_checker(job_id)
+
         # Check for cancellation
-        if job_manager.is_cancelled(job_id):
+        if is_cancelled():
             logger.info(f"Job {job_id} was cancelled before starting")
             return
 
-        # Get job metadata
-        job = job_manager.get_job(job_id)
-        if not job:
-            raise Exception(f"Job {job_id} not found")
-
-        config = EditConfig(**job['config'])
-        job_dir = JOBS_DIR / job_id
+        # Load input images (edit models need at least one)
+        input_paths = []
+        if spec['max_inputs']:
+            input_paths = _list_inputs(job_dir, spec['max_inputs'])
+            if not input_paths:
+                raise Exception("No input images found")
 
         # Progress callback
-        def progress_callback(stage: str, message: str, progress: int = 0):
-            if job_manager.is_cancelled(job_id):
-                raise asyncio.CancelledError("Job cancelled by user")
-            job_manager.update_progress(job_id, stage=stage, message=message, progress=progress)
-
-        progress_callback("preparing", "Starting Hunyuan Image 3 generation...", 5)
-
-        # Calculate cost
-        estimated_cost = replicate_client.calculate_cost("hunyuan", 1)
-        logger.info(f"Estimated cost for job {job_id}: ${estimated_cost:.2f}")
-
-        # Run in executor to avoid blocking
-        loop = asyncio.get_event_loop()
-        future = loop.run_in_executor(
-            None,
-            replicate_client.generate_image_hunyuan,
-            config.prompt,
-            config.aspect_ratio or "1:1",
-            config.go_fast,
-            config.seed,
-            config.output_format,
-            config.output_quality,
-            config.disable_safety_checker,
+        progress_callback = make_progress_callback(job_id, is_cancelled)
+
+        progress_callback("preparing", f"Starting {label}...", 5)
+
+        call = partial(
+            getattr(replicate_client, spec['method']),
+            *spec['args'](config, input_paths),
             job_dir,
             progress_callback,
-            lambda: job_manager.is_cancelled(job_id)
+            is_cancelled
         )
-        executor_futures[job_id] = future
+        if spec.get('cancel_event'):
+            call = partial(call, cancel_event=job_manager.get_cancellation_event(job_id))
 
-        try:
-            output_paths = await future
-        finally:
-            if job_id in executor_futures:
-                del executor_futures[job_id]
+        # Run in executor to avoid blocking, within this model's concurrency limit
+        async with model_semaphores[config.model_type]:
+            if is_cancelled():
+                logger.info(f"Job {job_id} was cancelled while queued")
+                return
+
+            future = asyncio.get_running_loop().run_in_executor(net_executor, call)
+            executor_futures[job_id] = future
+
+            try:
+                output_paths = await future
+            finally:
+                if job_id in executor_futures:
+                    del executor_futures[job_id]
 
         # Check cancellation
-        if job_manager.is_cancelled(job_id):
+        if is_cancelled():
             logger.info(f"Job {job_id} cancelled after generation")
             return
 
-        # Calculate actual cost
-        actual_cost = replicate_client.calculate_cost("hunyuan", len(output_paths))
+        # Calculate actual cost based on output images
+        cost = replicate_client.calculate_cost(config.model_type.value, len(output_paths))
 
         # Get relative paths for output images
         output_filenames = [Path(p).name for p in output_paths]
 
         # Update job with cost info and output images list
         job_manager.update_job_data(job_id, {
-            'cost': actual_cost,
+            'cost': cost,
             'images_generated': len(output_paths),
             'output_images': output_filenames
         })
 
         # Copy outputs to ~/output folder
-        copy_outputs_to_folder(job_id, output_filenames)
+        await copy_outputs_to_folder(job_id, output_filenames)
 
         # Mark as complete
         job_manager.set_status(job_id, JobStatus.COMPLETE)
-        progress_callback("complete", f"Hunyuan Image 3 complete! Cost: ${actual_cost:.2f}", 100)
-        logger.info(f"Job {job_id} completed successfully. Cost: ${actual_cost:.2f}")
+        progress_callback(
+            "complete",
+            f"{label} complete! Generated {len(output_paths)} image(s). Cost: ${cost:.3f}",
+            100
+        )
+        logger.info(f"Job {job_id} completed with {label}. Generated {len(output_paths)} image(s). Cost: ${cost:.3f}")
 
     except asyncio.CancelledError:
         logger.info(f"Job {job_id} was cancelled")
         job_manager.set_status(job_id, JobStatus.ERROR, error="Job cancelled by user")
     except Exception as e:
-        logger.error(f"Error in Hunyuan generation for job {job_id}: {str(e)}", exc_info=True)
+        logger.error(f"Error in {label} for job {job_id}: {str(e)}", exc_info=True)
         job_manager.set_status(job_id, JobStatus.ERROR, error=str(e))
 
 
-async def generate_image_task(job_id: str) -> None:
+async def generate_image_task(job_id: str, config: Optional[EditConfig] = None) -> None:
     """
     Execute image editing/generation task - routes to appropriate model
 
@@ -595,6 +699,10 @@ async def generate_image_task(job_id: str) -> None:
     - HYBRID models: seedream (flexible)
 
     Supports cancellation and proper error handling
+
+    Args:
+        job_id: Job identifier
+        config: Already-validated config; read from the job record when omitted
     """
     global image_editor, image_editor_gguf
 
@@ -604,33 +712,20 @@ async def generate_image_task(job_id: str) -> None:
         if not job:
             raise Exception(f"Job {job_id} not found")
 
-        config = EditConfig(**job['config'])
+        # Reuse the config validated at upload; otherwise validate once here.
+        # Either way the same instance is handed to the model runner
+        if config is None:
+            config = EditConfig(**job['config'])
+        job_dir = JOBS_DIR / job_id
+        is_cancelled = job_manager.cancellation_checker(job_id)
 
-        # Route to appropriate model (GENERATION models first)
-        if config.model_type == ModelType.HUNYUAN:
-            logger.info(f"Job {job_id} using Hunyuan Image 3 (GENERATION)")
-            await generate_image_hunyuan(job_id)
-            return
-        elif config.model_type == ModelType.QWEN_IMAGE:
-            logger.info(f"Job {job_id} using Qwen-Image text-to-image (GENERATION)")
-            await generate_image_qwen_text_to_image(job_id)
-            return
-        # HYBRID model
-        elif config.model_type == ModelType.SEEDREAM:
-            logger.info(f"Job {job_id} using Seedream-4 model")
-            await generate_image_seedream(job_id)
-            return
-        # EDIT models (cloud)
-        elif config.model_type == ModelType.QWEN_IMAGE_EDIT:
-            logger.info(f"Job {job_id} using Qwen-Image-Edit cloud (EDIT - preserves dimensions)")
-            await generate_image_qwen_cloud(job_id)
-            return
-        elif config.model_type == ModelType.QWEN_IMAGE_EDIT_PLUS:
-            logger.info(f"Job {job_id} using Qwen-Image-Edit-Plus (EDIT - preserves dimensions)")
-            await generate_image_qwen_plus(job_id)
+        # Cloud models (generation, hybrid and cloud edit) share one runner
+        if config.model_type in REPLICATE_MODELS:
+            logger.info(f"Job {job_id} using {REPLICATE_MODELS[config.model_type]['label']} (Replicate)")
+            await run_replicate_job(job_id, config, job_dir)
             return
         # EDIT model (local)
-        elif config.model_type == ModelType.QWEN_GGUF:
+        if config.model_type == ModelType.QWEN_GGUF:
             logger.info(f"Job {job_id} using Qwen GGUF (EDIT - preserves dimensions, {config.quantization_level})")
             use_gguf = True
             editor_instance_name = "image_editor_gguf"
@@ -639,16 +734,17 @@ async def generate_image_task(job_id: str) -> None:
 
         # Qwen processing starts here (both standard and GGUF)
         # Acquire semaphore to limit concurrent GPU jobs
-        async with active_job_semaphore:
+        async with model_semaphores[ModelType.QWEN_GGUF]:
             # Check for cancellation
-            if job_manager.is_cancelled(job_id):
+            if is_cancelled():
                 logger.info(f"Job {job_id} was cancelled before starting")
                 return
 
-            # Lazy load the model (only on first use)
+            # Lazy load the model (only on first use, or when the quantization level changes)
+            quantization_level = config.quantization_level if use_gguf else None
             editor = image_editor_gguf if use_gguf else image_editor
 
-            if editor is None:
+            if editor is None or not ImageEditor.is_cached(use_gguf, quantization_level, compile_transformer=TORCH_COMPILE):
                 model_desc = f"GGUF ({config.quantization_level})" if use_gguf else "standard"
                 logger.info(f"Loading Qwen-Image-Edit {model_desc} model...")
                 job_manager.update_progress(
@@ -673,17 +769,25 @@ async def generate_image_task(job_id: str) -> None:
                         progress=5 + int(progress_percent * 0.15)  # 5-20%
                     )
 
-                # Create the appropriate editor instance
-                if use_gguf:
-                    image_editor_gguf = ImageEditor(
+                # Drop our references so an evicted pipeline can be freed before the load
+                # (the cache still holds any editor that stays resident)
+                editor = image_editor = image_editor_gguf = None
+
+                # Load on the GPU thread; the event loop keeps serving progress meanwhile
+                editor = await asyncio.get_running_loop().run_in_executor(
+                    gpu_executor,
+                    lambda: ImageEditor.get_or_create(
                         progress_callback=model_loading_callback,
-                        use_gguf=True,
-                        quantization_level=config.quantization_level
+                        use_gguf=use_gguf,
+                        quantization_level=quantization_level,
+                        compile_transformer=TORCH_COMPILE
                     )
-                    editor = image_editor_gguf
+                )
+
+                if use_gguf:
+                    image_editor_gguf = editor
                 else:
-                    image_editor = ImageEditor(progress_callback=model_loading_callback)
-                    editor = image_editor
+                    image_editor = editor
 
                 # Mark model loading complete
                 job_manager.update_progress(
@@ -694,51 +798,29 @@ async def generate_image_task(job_id: str) -> None:
                 )
                 logger.info(f"Model loaded successfully ({model_desc})")
 
-            # Get job metadata
-            job = job_manager.get_job(job_id)
-            if not job:
-                raise Exception(f"Job {job_id} not found")
-
-            config = EditConfig(**job['config'])
-            job_dir = JOBS_DIR / job_id
-
             # Load input images
-            input_paths = []
-            if (job_dir / 'input_1.jpg').exists():
-                input_paths.append(str(job_dir / 'input_1.jpg'))
-            if (job_dir / 'input_2.jpg').exists():
-                input_paths.append(str(job_dir / 'input_2.jpg'))
+            input_paths = _list_inputs(job_dir, 2)
 
             if not input_paths:
                 raise Exception("No input images found")
 
             # Progress callback with cancellation check
-            def progress_callback(stage: str, message: str, progress: int = 0):
-                # Check for cancellation
-                if job_manager.is_cancelled(job_id):
-                    raise asyncio.CancelledError("Job cancelled by user")
-
-                job_manager.update_progress(
-                    job_id,
-                    stage=stage,
-                    message=message,
-                    progress=progress
-                )
+            progress_callback = make_progress_callback(job_id, is_cancelled)
 
             # Start image editing
             progress_callback("editing", "Starting image editing...", 25)
 
             # Check cancellation before running
-            if job_manager.is_cancelled(job_id):
+            if is_cancelled():
                 logger.info(f"Job {job_id} cancelled before inference")
                 return
 
             # Run image editing in executor to avoid blocking
-            loop = asyncio.get_event_loop()
+            loop = asyncio.get_running_loop()
 
             # Track the future for cleanup
             future = loop.run_in_executor(
-                None,
+                gpu_executor,
                 editor.edit_image,
                 input_paths,
                 config.prompt,
@@ -747,7 +829,7 @@ async def generate_image_task(job_id: str) -> None:
                 config.num_inference_steps,
                 str(job_dir / 'output.jpg'),
                 progress_callback,
-                lambda: job_manager.is_cancelled(job_id)  # Cancellation checker
+                is_cancelled  # Cancellation checker
             )
             executor_futures[job_id] = future
 
@@ -759,7 +841,7 @@ async def generate_image_task(job_id: str) -> None:
                     del executor_futures[job_id]
 
             # Final cancellation check
-            if job_manager.is_cancelled(job_id):
+            if is_cancelled():
                 logger.info(f"Job {job_id} cancelled after inference")
                 return
 
@@ -770,7 +852,7 @@ async def generate_image_task(job_id: str) -> None:
             })
 
             # Copy outputs to ~/output folder
-            copy_outputs_to_folder(job_id, output_filenames)
+            await copy_outputs_to_folder(job_id, output_filenames)
 
             job_manager.set_status(job_id, JobStatus.COMPLETE)
             progress_callback("complete", "Image editing complete!", 100)
@@ -784,69 +866,124 @@ async def generate_image_task(job_id: str) -> None:
         job_manager.set_status(job_id, JobStatus.ERROR, error=str(e))
 
 
+async def preload_model(quantization_level: str) -> None:
+    """
+    Load the local GGUF model in the background at startup
+
+    Holds the GPU semaphore while loading, so a job submitted meanwhile waits
+    for the load and then reuses the cached editor instead of loading it again.
+
+    Args:
+        quantization_level: GGUF quantization level to load
+    """
+    global image_editor_gguf
+
+    async with model_semaphores[ModelType.QWEN_GGUF]:
+        logger.info(f"Preloading Qwen-Image-Edit GGUF ({quantization_level}) model...")
+        try:
+            loop = asyncio.get_running_loop()
+            image_editor_gguf = await loop.run_in_executor(
+                gpu_executor,
+                lambda: ImageEditor.get_or_create(
+                    use_gguf=True,
+                    quantization_level=quantization_level,
+                    compile_transformer=TORCH_COMPILE
+                )
+            )
+            logger.info(f"Preloaded GGUF ({quantization_level}) model")
+        except Exception as e:
+            logger.error(f"Model preload failed, will load on first job: {str(e)}")
+
+
+def _release_gpu_memory() -> None:
+    """
+    Collect garbage and return cached allocator memory to the device
+
+    Blocking (hundreds of ms with a large model resident); called via to_thread
+    """
+    gc.collect()
+    if torch.cuda.is_available():
+        torch.cuda.ipc_collect()
+        torch.cuda.empty_cache()
+    elif torch.backends.mps.is_available():
+        torch.mps.empty_cache()
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Startup and shutdown events"""
+    global gpu_executor, net_executor
+
     # Startup
     logger.info("Starting Image Editor API...")
+    gpu_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="gpu")
+    net_executor = ThreadPoolExecutor(max_workers=REPLICATE_WORKERS, thread_name_prefix="replicate")
     JOBS_DIR.mkdir(parents=True, exist_ok=True)
     INPUT_FOLDER.mkdir(parents=True, exist_ok=True)
     OUTPUT_FOLDER.mkdir(parents=True, exist_ok=True)
-    logger.info(f"Input folder: {INPUT_FOLDER}")
-    logger.info(f"Output folder: {OUTPUT_FOLDER}")
+    logger.info(f"PYTORCH_CUDA_ALLOC_CONF: {os.environ['PYTORCH_CUDA_ALLOC_CONF']}")
+    logger.info(f"Settings: {settings}")
+
+    logger.info(f"Image codecs warmed up in {warm_image_codecs() * 1000:.0f}ms")
 
     # Set event loop in job_manager for WebSocket broadcasting
     loop = asyncio.get_running_loop()
     job_manager.set_event_loop(loop)
     logger.info("Event loop registered with JobManager")
 
+    # Optionally warm the local model so the first job doesn't pay the load cost
+    preload_task = None
+    if PRELOAD_MODEL and PRELOAD_MODEL.lower() != 'false':
+        quantization_level = 'Q4_K_M' if PRELOAD_MODEL.lower() == 'true' else PRELOAD_MODEL
+        preload_task = asyncio.create_task(preload_model(quantization_level))
+
     yield
 
+    if preload_task and not preload_task.done():
+        preload_task.cancel()
+
     # Shutdown
     logger.info("Shutting down...")
 
-    # Request cancellation for all active jobs
-    for job_id in list(job_manager.job_tasks.keys()):
+    # Request cancellation for all active jobs and cancel their asyncio tasks
+    tasks = []
+    for job_id, task in list(job_manager.job_tasks.items()):
         logger.info(f"Requesting cancellation for job {job_id}")
         job_manager.request_cancellation(job_id)
-
-    # Cancel asyncio tasks
-    for job_id, task in list(job_manager.job_tasks.items()):
         if not task.done():
-            logger.info(f"Cancelling asyncio task for job {job_id}")
             task.cancel()
-
-    # Wait for executor futures with timeout
-    if executor_futures:
-        logger.warning(f"Waiting up to 5 seconds for {len(executor_futures)} inference thread(s) to finish...")
-        logger.warning("Note: Diffusers pipeline cannot be interrupted mid-inference")
-
-        try:
-            # Give threads 5 seconds to finish gracefully
-            await asyncio.wait_for(
-                asyncio.gather(*[f for f in executor_futures.values()], return_exceptions=True),
-                timeout=5.0
-            )
-            logger.info("All inference threads completed")
-        except asyncio.TimeoutError:
-            logger.warning("Inference threads did not complete in time - forcing shutdown")
+            tasks.append(task)
+
+    # Wait for the tasks' cancellation handlers and any executor futures together
+    pending_work = tasks + list(executor_futures.values())
+    if pending_work:
+        if executor_futures:
+            logger.warning(f"Waiting up to 5 seconds for {len(executor_futures)} inference thread(s) to finish...")
+            logger.warning("Note: Diffusers pipeline cannot be interrupted mid-inference")
+
+        _, pending = await asyncio.wait(pending_work, timeout=5.0)
+        if pending:
+            logger.warning(f"{len(pending)} job(s) did not finish in time - forcing shutdown")
             logger.warning("GPU memory may not be fully released until process terminates")
+        else:
+            logger.info("All jobs and inference threads completed")
+
+    # Drop queued work; a call already running can't be interrupted and is left to finish
+    gpu_executor.shutdown(wait=False, cancel_futures=True)
+    net_executor.shutdown(wait=False, cancel_futures=True)
 
-    # Force GPU cleanup if image_editor is loaded
-    if image_editor is not None:
+    # Force GPU cleanup if a local model is loaded
+    if image_editor is not None or image_editor_gguf is not None:
         try:
             logger.info("Clearing GPU cache...")
-            import torch
-            import gc
-            if torch.cuda.is_available():
-                torch.cuda.empty_cache()
-            elif torch.backends.mps.is_available():
-                torch.mps.empty_cache()
-            gc.collect()
+            await asyncio.to_thread(_release_gpu_memory)
             logger.info("GPU cache cleared")
         except Exception as e:
             logger.error(f"Error clearing GPU cache: {e}")
 
+    # Persist any progress updates still waiting for the background flusher
+    job_manager.close()
+
     logger.info("Shutdown complete")
 
 
@@ -855,20 +992,14 @@ app = FastAPI(
     title="Image Editor API",
     description="AI-powered image editing with Qwen, GGUF, and Seedream models",
     version="2.0.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    # Job listings and status polls are encoded with orjson when it's installed
+    default_response_class=APIResponse
 )
 
 # CORS middleware with WebSocket support
-# Add RunPod proxy domains if running on RunPod
-if os.getenv('RUNPOD_POD_ID'):
-    pod_id = os.getenv('RUNPOD_POD_ID')
-    ALLOWED_ORIGINS.extend([
-        f"https://{pod_id}-3000.proxy.runpod.net",
-        f"https://{pod_id}-5173.proxy.runpod.net"
-    ])
-
 # Allow wildcard for development, specific origins for production
-allow_origins = ["*"] if os.getenv('ENV', 'development') == 'development' else ALLOWED_ORIGINS
+allow_origins = ["*"] if settings.development else list(settings.allowed_origins)
 
 app.add_middleware(
     CORSMiddleware,
@@ -880,6 +1011,57 @@ app.add_middleware(
 )
 
 
+# Last input-folder listing: (folder mtime_ns, monotonic time taken, images).
+# Reused while the folder is unchanged and the entry is younger than the TTL;
+# the TTL catches files rewritten in place, which don't touch the folder mtime
+INPUT_LISTING_TTL = 2.0
+# Threads reading image headers during a scan (file I/O releases the GIL)
+INPUT_SCAN_WORKERS = 8
+_input_listing: Optional[Tuple[int, float, List[Dict[str, Any]]]] = None
+
+
+def _scan_input_folder() -> List[Dict[str, Any]]:
+    """
+    Scan INPUT_FOLDER for images
+
+    Header reads for dimensions run on a small thread pool, so on a cold cache
+    (or a network volume) several reads are in flight at once.
+
+    Returns:
+        Image metadata dicts, newest first
+    """
+    images = []
+    paths = []
+    # scandir reuses the directory listing's file type, so each image costs one stat
+    with os.scandir(INPUT_FOLDER) as entries:
+        for entry in entries:
+            if os.path.splitext(entry.name)[1].lower() not in IMAGE_EXTENSIONS or not entry.is_file():
+                continue
+
+            stat = entry.stat()
+            images.append({
+                'filename': entry.name,
+                'size_bytes': stat.st_size,
+                'modified': stat.st_mtime
+            })
+            paths.append(entry.path)
+
+    if len(paths) > 1:
+        with ThreadPoolExecutor(max_workers=min(INPUT_SCAN_WORKERS, len(paths))) as pool:
+            sizes = list(pool.map(read_image_size, paths))
+    else:
+        sizes = [read_image_size(path) for path in paths]
+
+    # If can't read it as an image, just include basic info
+    for info, size in zip(images, sizes):
+        if size is not None:
+            info['width'], info['height'] = size
+
+    # Sort by modified time (newest first)
+    images.sort(key=lambda x: x.get('modified', 0), reverse=True)
+    return images
+
+
 @app.get("/api/input-folder/list")
 async def list_input_folder():
     """
@@ -888,57 +1070,49 @@ async def list_input_folder():
     Returns:
         List of image files with metadata
     """
+    global _input_listing
+
     try:
-        if not INPUT_FOLDER.exists():
+        try:
+            folder_mtime = os.stat(INPUT_FOLDER).st_mtime_ns
+        except FileNotFoundError:
             return {
                 "folder": str(INPUT_FOLDER),
                 "images": [],
                 "count": 0
             }
 
-        # Supported image extensions
-        image_extensions = {'.jpg', '.jpeg', '.png', '.webp', '.bmp'}
-
-        images = []
-        for file_path in INPUT_FOLDER.iterdir():
-            if file_path.is_file() and file_path.suffix.lower() in image_extensions:
-                try:
-                    from PIL import Image
-                    img = Image.open(file_path)
-                    images.append({
-                        'filename': file_path.name,
-                        'size_bytes': file_path.stat().st_size,
-                        'width': img.width,
-                        'height': img.height,
-                        'modified': file_path.stat().st_mtime
-                    })
-                except:
-                    # If can't open as image, just include basic info
-                    images.append({
-                        'filename': file_path.name,
-                        'size_bytes': file_path.stat().st_size,
-                        'modified': file_path.stat().st_mtime
-                    })
-
-        # Sort by modified time (newest first)
-        images.sort(key=lambda x: x.get('modified', 0), reverse=True)
+        now = time.monotonic()
+        cached = _input_listing
+        if cached and cached[0] == folder_mtime and now - cached[1] < INPUT_LISTING_TTL:
+            images = cached[2]
+        else:
+            # Directory walk and header reads block; keep them off the event loop
+            images = await asyncio.to_thread(_scan_input_folder)
+            _input_listing = (folder_mtime, now, images)
 
-        return {
+        return APIResponse({
             "folder": str(INPUT_FOLDER),
             "images": images,
             "count": len(images)
-        }
+        })
 
     except Exception as e:
         logger.error(f"Error listing input folder: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.get("/")
-async def root():
-    """Health check endpoint"""
-    import torch
+@lru_cache(maxsize=1)
+def _root_info() -> bytes:
+    """
+    Build the health check response body
+
+    Device, folders and models don't change while the server runs, so the
+    device probe and the JSON encode happen on the first request only.
 
+    Returns:
+        JSON-encoded response body
+    """
     # Detect device
     device = "cpu"
     if torch.cuda.is_available():
@@ -946,7 +1120,7 @@ async def root():
     elif torch.backends.mps.is_available():
         device = "mps"
 
-    return {
+    return json.dumps({
         "status": "online",
         "message": "Image Editor API is running",
         "device": device,
@@ -1008,7 +1182,48 @@ async def root():
                 "outputs": "1-15 images (flexible size)"
             }
         }
-    }
+    }).encode()
+
+
+@app.get("/")
+async def root():
+    """Health check endpoint"""
+    return Response(content=_root_info(), media_type="application/json")
+
+
+@lru_cache(maxsize=1)
+def _input_folder_prefix() -> str:
+    """Resolved INPUT_FOLDER plus a trailing separator (resolved on first use)"""
+    return os.path.join(os.path.realpath(INPUT_FOLDER), '')
+
+
+def resolve_input_path(filename: str) -> Optional[str]:
+    """
+    Resolve a filename inside INPUT_FOLDER, refusing anything that escapes it
+
+    Symlinks and '..' are resolved first, so the check applies to the real
+    target; containment is a plain prefix compare on the resolved folder.
+
+    Args:
+        filename: Filename (or relative path) requested by the client
+
+    Returns:
+        Resolved path, or None if it points outside INPUT_FOLDER
+    """
+    file_path = os.path.realpath(os.path.join(INPUT_FOLDER, filename))
+    return file_path if file_path.startswith(_input_folder_prefix()) else None
+
+
+class ImageFileResponse(FileResponse):
+    """
+    FileResponse for image downloads
+
+    Starlette reads each chunk on a worker thread; multi-MB images go out in
+    1MB chunks instead of the default 64KB, so far fewer thread round trips
+    per download. Callers pass stat_result from their existence check, which
+    spares Starlette its own stat.
+    """
+    chunk_size = 1024 * 1024
 
 
 @app.get("/api/input-folder/image/{filename}")
@@ -1024,38 +1239,26 @@ async def get_input_folder_image(filename: str):
     """
     try:
         # SECURITY: Prevent path traversal attacks
-        # Resolve the path and ensure it stays within INPUT_FOLDER
-        file_path = (INPUT_FOLDER / filename).resolve()
-        input_folder_resolved = INPUT_FOLDER.resolve()
-
-        # Check if the resolved path is within INPUT_FOLDER
-        try:
-            file_path.relative_to(input_folder_resolved)
-        except ValueError:
+        file_path = resolve_input_path(filename)
+        if file_path is None:
             # Path is outside INPUT_FOLDER
             logger.warning(f"Path traversal attempt blocked: {filename}")
             raise HTTPException(status_code=403, detail="Access denied: path traversal detected")
 
-        if not file_path.exists():
+        try:
+            stat_result = os.stat(file_path)
+        except FileNotFoundError:
             raise HTTPException(status_code=404, detail="Image not found in input folder")
 
-        if file_path.suffix.lower() not in {'.jpg', '.jpeg', '.png', '.webp', '.bmp'}:
+        media_type = IMAGE_MEDIA_TYPES.get(os.path.splitext(file_path)[1].lower())
+        if media_type is None:
             raise HTTPException(status_code=400, detail="Invalid image format")
 
-        # Determine media type
-        media_type_map = {
-            '.jpg': 'image/jpeg',
-            '.jpeg': 'image/jpeg',
-            '.png': 'image/png',
-            '.webp': 'image/webp',
-            '.bmp': 'image/bmp'
-        }
-        media_type = media_type_map.get(file_path.suffix.lower(), 'image/jpeg')
-
-        return FileResponse(
+        return ImageFileResponse(
             file_path,
             media_type=media_type,
-            filename=filename
+            filename=filename,
+            stat_result=stat_result
         )
 
     except HTTPException:
@@ -1079,22 +1282,17 @@ async def load_from_input_folder(filenames: list[str]):
     try:
         # Validate files exist
         file_paths = []
-        input_folder_resolved = INPUT_FOLDER.resolve()
 
         for filename in filenames[:10]:  # Max 10 images
             # SECURITY: Prevent path traversal attacks
-            file_path = (INPUT_FOLDER / filename).resolve()
-
-            # Check if the resolved path is within INPUT_FOLDER
-            try:
-                file_path.relative_to(input_folder_resolved)
-            except ValueError:
+            file_path = resolve_input_path(filename)
+            if file_path is None:
                 logger.warning(f"Path traversal attempt blocked: {filename}")
                 raise HTTPException(status_code=403, detail=f"Access denied: path traversal detected for {filename}")
 
-            if not file_path.exists():
+            if not os.path.exists(file_path):
                 raise HTTPException(status_code=404, detail=f"File not found: {filename}")
-            if file_path.suffix.lower() not in {'.jpg', '.jpeg', '.png', '.webp', '.bmp'}:
+            if os.path.splitext(file_path)[1].lower() not in IMAGE_EXTENSIONS:
                 raise HTTPException(status_code=400, detail=f"Invalid image format: {filename}")
             file_paths.append(file_path)
 
@@ -1104,7 +1302,7 @@ async def load_from_input_folder(filenames: list[str]):
         return {
             "status": "success",
             "images_loaded": len(file_paths),
-            "filenames": [p.name for p in file_paths],
+            "filenames": [os.path.basename(p) for p in file_paths],
             "message": f"Loaded {len(file_paths)} images from input folder"
         }
 
@@ -1115,6 +1313,28 @@ async def load_from_input_folder(filenames: list[str]):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def _save_inputs(job_dir: Path, contents: List[Optional[bytes]]) -> int:
+    """
+    Create the job directory and write its input images
+
+    Args:
+        job_dir: Job directory
+        contents: Image bytes per input slot (input_1.jpg, input_2.jpg, ...);
+            None leaves that slot empty
+
+    Returns:
+        Number of images written
+    """
+    job_dir.mkdir(parents=True, exist_ok=True)
+    count = 0
+    for index, content in enumerate(contents, start=1):
+        if content:
+            with open(job_dir / f'input_{index}.jpg', 'wb') as f:
+                f.write(content)
+            count += 1
+    return count
+
+
 @app.post("/api/edit")
 async def edit_image(
     image1: Optional[UploadFile] = File(None, description="Primary input image (optional for text-to-image models)"),
@@ -1159,26 +1379,14 @@ async def edit_image(
         # Create job
         job_id = job_manager.create_job(edit_config.model_dump())
         job_dir = JOBS_DIR / job_id
-        job_dir.mkdir(parents=True, exist_ok=True)
-
-        # Save validated input images (if any)
-        image_count = 0
-        if image1_content:
-            image1_path = job_dir / 'input_1.jpg'
-            with open(image1_path, 'wb') as f:
-                f.write(image1_content)
-            image_count += 1
-
-        if image2_content:
-            image2_path = job_dir / 'input_2.jpg'
-            with open(image2_path, 'wb') as f:
-                f.write(image2_content)
-            image_count += 1
+
+        # Save validated input images (if any), off the event loop
+        image_count = await asyncio.to_thread(_save_inputs, job_dir, [image1_content, image2_content])
 
         logger.info(f"Created job {job_id} with {image_count} image(s) for model {edit_config.model_type}")
 
         # Start processing in background and register task
-        task = asyncio.create_task(generate_image_task(job_id))
+        task = asyncio.create_task(generate_image_task(job_id, edit_config))
         job_manager.register_task(job_id, task)
 
         # Add exception callback to log unhandled errors
@@ -1217,6 +1425,49 @@ async def get_job_status(job_id: str):
     return JobStatusResponse(**job)
 
 
+def _describe_output_images(job_id: str, output_images: List[str]) -> List[Dict[str, Any]]:
+    """
+    Collect size and dimensions of a job's output images
+
+    Args:
+        job_id: Job identifier
+        output_images: Output filenames, in index order
+
+    Returns:
+        Metadata for each output that exists on disk
+    """
+    # One directory scan answers every existence check
+    try:
+        with os.scandir(JOBS_DIR / job_id) as it:
+            entries = {entry.name: entry for entry in it}
+    except FileNotFoundError:
+        return []
+
+    images_info = []
+    for index, filename in enumerate(output_images):
+        entry = entries.get(filename)
+        if entry is None:
+            continue
+
+        size = read_image_size(entry.path)
+        if size is not None:
+            images_info.append({
+                'index': index,
+                'filename': filename,
+                'width': size[0],
+                'height': size[1],
+                'size_bytes': entry.stat().st_size,
+                'download_url': f"/api/jobs/{job_id}/images/{index}"
+            })
+        else:
+            images_info.append({
+                'index': index,
+                'filename': filename,
+                'download_url': f"/api/jobs/{job_id}/images/{index}"
+            })
+    return images_info
+
+
 @app.get("/api/jobs/{job_id}/images")
 async def list_output_images(job_id: str):
     """
@@ -1233,36 +1484,15 @@ async def list_output_images(job_id: str):
         raise HTTPException(status_code=400, detail="Job not complete yet")
 
     output_images = job.get('output_images', ['output.jpg'])
-    job_dir = JOBS_DIR / job_id
 
-    # Build response with image metadata
-    images_info = []
-    for index, filename in enumerate(output_images):
-        img_path = job_dir / filename
-        if img_path.exists():
-            from PIL import Image
-            try:
-                img = Image.open(img_path)
-                images_info.append({
-                    'index': index,
-                    'filename': filename,
-                    'width': img.width,
-                    'height': img.height,
-                    'size_bytes': img_path.stat().st_size,
-                    'download_url': f"/api/jobs/{job_id}/images/{index}"
-                })
-            except:
-                images_info.append({
-                    'index': index,
-                    'filename': filename,
-                    'download_url': f"/api/jobs/{job_id}/images/{index}"
-                })
-
-    return {
+    # Build response with image metadata (file reads run off the event loop)
+    images_info = await asyncio.to_thread(_describe_output_images, job_id, output_images)
+
+    return APIResponse({
         'job_id': job_id,
         'images_count': len(images_info),
         'images': images_info
-    }
+    })
 
 
 @app.get("/api/jobs/{job_id}/images/{image_index}")
@@ -1292,13 +1522,16 @@ async def download_image_by_index(job_id: str, image_index: int):
     filename = output_images[image_index]
     output_path = JOBS_DIR / job_id / filename
 
-    if not output_path.exists():
+    try:
+        stat_result = os.stat(output_path)
+    except FileNotFoundError:
         raise HTTPException(status_code=404, detail="Output image not found")
 
-    return FileResponse(
+    return ImageFileResponse(
         output_path,
         media_type="image/jpeg",
-        filename=f"edited_{job_id}_{image_index}.jpg"
+        filename=f"edited_{job_id}_{image_index}.jpg",
+        stat_result=stat_result
     )
 
 
@@ -1328,14 +1561,10 @@ async def websocket_endpoint(websocket: WebSocket, job_id: str):
     job_manager.add_ws_connection(job_id, websocket)
 
     try:
-        # Send initial status
-        job = job_manager.get_job(job_id)
-        if job:
-            await websocket.send_json({
-                "status": job['status'],
-                "progress": job.get('progress'),
-                "error": job.get('error')
-            })
+        # Send initial status (same encoding as the broadcasts)
+        payload = job_manager.status_message(job_id)
+        if payload is not None:
+            await websocket.send_text(payload)
 
         # Keep connection alive and listen for disconnect
         while True:
@@ -1361,15 +1590,12 @@ async def cleanup_old_jobs(hours: int = 1):
     Default: Remove jobs older than 1 hour
     """
     try:
-        import time
         cutoff_time = time.time() - (hours * 3600)
         deleted = []
 
-        for job_id in list(job_manager.jobs.keys()):
-            job = job_manager.get_job(job_id)
-            if job and job.get('created_at', 0) < cutoff_time:
-                if job_manager.delete_job(job_id):
-                    deleted.append(job_id)
+        for job_id in job_manager.jobs_created_before(cutoff_time):
+            if job_manager.delete_job(job_id):
+                deleted.append(job_id)
 
         return {
             "message": f"Cleaned up {len(deleted)} jobs older than {hours} hour(s)",
@@ -1384,11 +1610,11 @@ async def cleanup_old_jobs(hours: int = 1):
 if __name__ == "__main__":
     import uvicorn
 
-    logger.info(f"Starting server on {HOST}:{PORT}")
+    logger.info(f"Starting server on {settings.host}:{settings.port}")
     uvicorn.run(
         "main:app",
-        host=HOST,
-        port=PORT,
+        host=settings.host,
+        port=settings.port,
         log_level="info",
         ws_ping_interval=20,  # Send ping every 20 seconds
         ws_ping_timeout=20,   # Wait 20 seconds for pong
@@ -21,7 +21,7 @@ CRITICAL DESIGN PRINCIPLE - EDIT vs GENERATION:
    - Can edit (with images) or generate (without images)
 """
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
 from typing import Optional
 from enum import Enum
 
@@ -68,7 +68,7 @@ class EditConfig(BaseModel):
         negative_prompt: What to avoid in the output (Qwen only)
 
         # Qwen GGUF-specific (LOCAL EDIT):
-        quantization_level: Quantization level (Q5_K_S recommended)
+        quantization_level: Quantization level (Q4_K_M recommended)
         true_cfg_scale: Guidance scale (higher = more prompt adherence)
         num_inference_steps: Diffusion steps (higher = better quality, slower)
 
@@ -86,6 +86,9 @@ class EditConfig(BaseModel):
         sequential_image_generation: Enable auto multi-image generation
         max_images: Max images to generate
     """
+    # Immutable once validated, so one instance is shared for the whole job
+    model_config = ConfigDict(frozen=True, extra='ignore')
+
     model_type: ModelType = Field(
         ModelType.QWEN_GGUF,
         description="Which model to use for image editing"
@@ -110,7 +113,7 @@ class EditConfig(BaseModel):
         description="Classifier-free guidance scale (Qwen only)"
     )
     num_inference_steps: int = Field(
-        50,
+        25,
         ge=10,
         le=100,
         description="Number of diffusion steps (Qwen only)"
@@ -118,8 +121,8 @@ class EditConfig(BaseModel):
 
     # Qwen GGUF-specific parameters
     quantization_level: Optional[str] = Field(
-        "Q5_K_S",
-        description="Quantization level: Q2_K (7GB), Q4_K_M (14GB), Q5_K_S (17GB), Q8_0 (22GB) (GGUF only)"
+        "Q4_K_M",
+        description="Quantization level: Q2_K (7GB), Q4_K_M (14GB), Q5_K_S (17GB), Q6_K (19GB), Q8_0 (22GB) (GGUF only)"
     )
 
     # Replicate cloud model common parameters
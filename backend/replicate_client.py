@@ -4,7 +4,9 @@ Replicate API client for Seedream-4 image generation
 
 import os
 import json
+import time
 import logging
+from threading import Event
 from typing import List, Callable, Optional, Tuple
 import replicate
 from pathlib import Path
@@ -19,6 +21,12 @@ QWEN_IMAGE_EDIT_PLUS_PRICE = 0.02  # $0.02 per prediction
 QWEN_IMAGE_PRICE = 0.015  # $0.015 per prediction
 HUNYUAN_IMAGE_PRICE = 0.02  # $0.02 per prediction (estimated)
 
+# Seconds between prediction status checks (also the worst-case cancellation delay)
+PREDICTION_POLL_INTERVAL = 0.5
+
+# Bytes per write when streaming an output image to disk
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
 
 class ReplicateClient:
     """
@@ -42,6 +50,89 @@ class ReplicateClient:
         # Set API token for replicate library
         os.environ['REPLICATE_API_TOKEN'] = self.api_token
 
+    @staticmethod
+    def _run_prediction(
+        model: str,
+        input_data: dict,
+        is_cancelled: Optional[Callable[[], bool]] = None,
+        cancel_event: Optional[Event] = None
+    ):
+        """
+        Run a model and wait for its output, cancelling it if the job is cancelled
+
+        Unlike replicate.run, which blocks until the prediction finishes, this
+        polls the prediction itself: a cancelled job cancels the remote
+        prediction (stopping its compute and billing) and frees the worker
+        thread within one poll interval.
+
+        Args:
+            model: Model name (owner/name)
+            input_data: Model input
+            is_cancelled: Cancellation checker
+            cancel_event: Job's cancellation event; polls wait on it so a
+                cancellation is noticed immediately
+
+        Returns:
+            Prediction output
+
+        Raises:
+            Exception: If the prediction fails or the job is cancelled
+        """
+        prediction = replicate.models.predictions.create(model=model, input=input_data)
+
+        while prediction.status not in ("succeeded", "failed", "canceled"):
+            if cancel_event is not None:
+                cancel_event.wait(PREDICTION_POLL_INTERVAL)
+            else:
+                time.sleep(PREDICTION_POLL_INTERVAL)
+
+            if is_cancelled and is_cancelled():
+                try:
+                    prediction.cancel()
+                    logger.info(f"Cancelled Replicate prediction {prediction.id} ({model})")
+                except Exception as e:
+                    logger.warning(f"Could not cancel Replicate prediction {prediction.id}: {str(e)}")
+                raise Exception("Job cancelled during generation")
+
+            prediction.reload()
+
+        if prediction.status != "succeeded":
+            raise Exception(f"Prediction {prediction.status}: {prediction.error}")
+
+        return prediction.output
+
+    @staticmethod
+    def _save_output(item, output_path) -> None:
+        """
+        Write one prediction output to output_path
+
+        URLs are streamed to disk in chunks instead of buffering the whole
+        image in memory, and the file is written under a temporary name and
+        renamed into place, so a partial download is never seen as an output.
+
+        Args:
+            item: Output with .read() or .url(), or a URL string
+            output_path: Destination file path
+        """
+        tmp_path = f"{output_path}.part"
+        try:
+            with open(tmp_path, 'wb') as f:
+                if hasattr(item, 'read'):
+                    f.write(item.read())
+                else:
+                    url = item.url() if hasattr(item, 'url') else item
+                    with requests.get(url, stream=True, timeout=60) as response:
+                        response.raise_for_status()
+                        for chunk in response.iter_content(DOWNLOAD_CHUNK_SIZE):
+                            f.write(chunk)
+            os.replace(tmp_path, output_path)
+        except BaseException:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
+
     def edit_image(
         self,
         image_paths: List[str],
@@ -54,7 +145,8 @@ class ReplicateClient:
         disable_safety_checker: bool = True,
         output_dir: Path = None,
         progress_callback: Optional[Callable] = None,
-        is_cancelled: Optional[Callable[[], bool]] = None
+        is_cancelled: Optional[Callable[[], bool]] = None,
+        cancel_event: Optional[Event] = None
     ) -> List[str]:
         """
         Edit image(s) using Seedream-4 on Replicate
@@ -70,6 +162,8 @@ class ReplicateClient:
             output_dir: Directory to save output images
             progress_callback: Callback for progress updates
             is_cancelled: Callback to check if job is cancelled
+            cancel_event: Job's cancellation event; retry delays wait on it, so a
+                cancellation ends the wait at once instead of after the full delay
 
         Returns:
             List of output image paths
@@ -170,16 +264,20 @@ class ReplicateClient:
                                 f"Retrying Seedream-4 (attempt {attempt + 1}/{max_retries})...",
                                 30 + (attempt * 5)
                             )
-                        import time
-                        time.sleep(retry_delay)
+                        if cancel_event is not None:
+                            cancel_event.wait(retry_delay)
+                        else:
+                            time.sleep(retry_delay)
 
                         # Check cancellation before retry
                         if is_cancelled and is_cancelled():
                             raise Exception("Job cancelled during retry")
 
-                    output = replicate.run(
+                    output = self._run_prediction(
                         "bytedance/seedream-4",
-                        input=input_data
+                        input_data,
+                        is_cancelled,
+                        cancel_event
                     )
 
                     logger.info(f"Seedream-4 API returned {len(output) if hasattr(output, '__len__') else 1} output(s)")
@@ -249,8 +347,7 @@ class ReplicateClient:
                     # Method 1: Try .read() first (most direct, official API pattern)
                     if hasattr(item, 'read'):
                         logger.info(f"Output {index + 1}: Using .read() method (official API pattern)")
-                        with open(output_path, 'wb') as f:
-                            f.write(item.read())
+                        self._save_output(item, output_path)
                         logger.info(f"✓ Saved {output_path}")
 
                     # Method 2: Try .url() (official API pattern for URL access)
@@ -258,20 +355,14 @@ class ReplicateClient:
                         url = item.url()
                         logger.info(f"Output {index + 1}: Using .url() method (official API pattern)")
                         logger.info(f"  URL: {url}")
-                        response = requests.get(url, timeout=60)
-                        response.raise_for_status()
-                        with open(output_path, 'wb') as f:
-                            f.write(response.content)
+                        self._save_output(url, output_path)
                         logger.info(f"✓ Downloaded and saved {output_path}")
 
                     # Method 3: Fallback - treat as direct URL string
                     elif isinstance(item, str):
                         logger.info(f"Output {index + 1}: Direct URL string (fallback)")
                         logger.info(f"  URL: {item}")
-                        response = requests.get(item, timeout=60)
-                        response.raise_for_status()
-                        with open(output_path, 'wb') as f:
-                            f.write(response.content)
+                        self._save_output(item, output_path)
                         logger.info(f"✓ Downloaded and saved {output_path}")
 
                     else:
@@ -360,7 +451,7 @@ class ReplicateClient:
             if progress_callback:
                 progress_callback("generating", "Editing with Qwen-Image-Edit cloud...", 30)
 
-            output = replicate.run("qwen/qwen-image-edit", input=input_data)
+            output = self._run_prediction("qwen/qwen-image-edit", input_data, is_cancelled)
 
             # Close file handle
             if file_handle:
@@ -384,19 +475,7 @@ class ReplicateClient:
 
                 output_path = output_dir / f"output_{index}.{output_format}"
 
-                if hasattr(item, 'read'):
-                    with open(output_path, 'wb') as f:
-                        f.write(item.read())
-                elif hasattr(item, 'url'):
-                    response = requests.get(item.url(), timeout=60)
-                    response.raise_for_status()
-                    with open(output_path, 'wb') as f:
-                        f.write(response.content)
-                else:
-                    response = requests.get(item, timeout=60)
-                    response.raise_for_status()
-                    with open(output_path, 'wb') as f:
-                        f.write(response.content)
+                self._save_output(item, output_path)
 
                 output_paths.append(str(output_path))
 
@@ -474,7 +553,7 @@ class ReplicateClient:
             if progress_callback:
                 progress_callback("generating", "Processing with Qwen-Image-Edit-Plus...", 30)
 
-            output = replicate.run("qwen/qwen-image-edit-plus", input=input_data)
+            output = self._run_prediction("qwen/qwen-image-edit-plus", input_data, is_cancelled)
 
             # Close file handles
             for fh in file_handles:
@@ -498,19 +577,7 @@ class ReplicateClient:
             for index, item in enumerate(output):
                 output_path = output_dir / f"output_{index}.{output_format}"
 
-                if hasattr(item, 'read'):
-                    with open(output_path, 'wb') as f:
-                        f.write(item.read())
-                elif hasattr(item, 'url'):
-                    response = requests.get(item.url(), timeout=60)
-                    response.raise_for_status()
-                    with open(output_path, 'wb') as f:
-                        f.write(response.content)
-                else:
-                    response = requests.get(item, timeout=60)
-                    response.raise_for_status()
-                    with open(output_path, 'wb') as f:
-                        f.write(response.content)
+                self._save_output(item, output_path)
 
                 output_paths.append(str(output_path))
 
@@ -601,7 +668,7 @@ class ReplicateClient:
             if progress_callback:
                 progress_callback("generating", "Generating image with Qwen-Image...", 30)
 
-            output = replicate.run("qwen/qwen-image", input=input_data)
+            output = self._run_prediction("qwen/qwen-image", input_data, is_cancelled)
 
             if progress_callback:
                 progress_callback("downloading", "Downloading result...", 70)
@@ -617,19 +684,7 @@ class ReplicateClient:
             for index, item in enumerate(output):
                 output_path = output_dir / f"output_{index}.{output_format}"
 
-                if hasattr(item, 'read'):
-                    with open(output_path, 'wb') as f:
-                        f.write(item.read())
-                elif hasattr(item, 'url'):
-                    response = requests.get(item.url(), timeout=60)
-                    response.raise_for_status()
-                    with open(output_path, 'wb') as f:
-                        f.write(response.content)
-                else:
-                    response = requests.get(item, timeout=60)
-                    response.raise_for_status()
-                    with open(output_path, 'wb') as f:
-                        f.write(response.content)
+                self._save_output(item, output_path)
 
                 output_paths.append(str(output_path))
 
@@ -700,7 +755,7 @@ class ReplicateClient:
             if progress_callback:
                 progress_callback("generating", "Generating image with Hunyuan Image 3...", 30)
 
-            output = replicate.run("tencent/hunyuan-image-3", input=input_data)
+            output = self._run_prediction("tencent/hunyuan-image-3", input_data, is_cancelled)
 
             if progress_callback:
                 progress_callback("downloading", "Downloading result...", 70)
@@ -719,19 +774,7 @@ class ReplicateClient:
 
                 output_path = output_dir / f"output_{index}.{output_format}"
 
-                if hasattr(item, 'read'):
-                    with open(output_path, 'wb') as f:
-                        f.write(item.read())
-                elif hasattr(item, 'url'):
-                    response = requests.get(item.url(), timeout=60)
-                    response.raise_for_status()
-                    with open(output_path, 'wb') as f:
-                        f.write(response.content)
-                else:
-                    response = requests.get(item, timeout=60)
-                    response.raise_for_status()
-                    with open(output_path, 'wb') as f:
-                        f.write(response.content)
+                self._save_output(item, output_path)
 
                 output_paths.append(str(output_path))
 
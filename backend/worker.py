@@ -0,0 +1,254 @@
+"""
+Resident worker for the local Qwen-Image-Edit model
+Loads one ImageEditor and serves edit requests over a Unix socket, so
+scripts and CLI callers reuse the loaded model instead of paying the
+model-load cost on every invocation (the API server already keeps its
+own editor resident)
+"""
+
+import argparse
+import os
+import secrets
+import stat
+import sys
+import tempfile
+import logging
+from multiprocessing.connection import Listener, Client
+from typing import List, Optional
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(levelname)s: %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# The socket and its authkey file live in a per-user 0700 directory, so other
+# local users can't reach the socket even before the handshake
+DEFAULT_SOCKET_PATH = os.getenv(
+    'WORKER_SOCKET',
+    os.path.join(tempfile.gettempdir(), f'qwen-editor-{os.getuid()}', 'worker.sock')
+)
+DEFAULT_OUTPUT_DIR = os.getenv('WORKER_OUTPUT_DIR', os.getenv('JOBS_DIR', '/workspace/jobs'))
+AUTHKEY_FILENAME = 'authkey'
+
+# edit_image arguments a client may set; anything else is rejected
+REQUEST_KEYS = frozenset({
+    'image_paths', 'prompt', 'negative_prompt',
+    'true_cfg_scale', 'num_inference_steps', 'output_path'
+})
+
+
+def _private_dir(socket_path: str) -> str:
+    """
+    Create (if needed) and verify the directory holding the socket
+
+    Raises:
+        RuntimeError: If the directory is a symlink, not ours, or open to other users
+    """
+    socket_dir = os.path.dirname(os.path.abspath(socket_path))
+    os.makedirs(socket_dir, mode=0o700, exist_ok=True)
+
+    st = os.lstat(socket_dir)
+    if not stat.S_ISDIR(st.st_mode) or st.st_uid != os.getuid() or st.st_mode & 0o077:
+        raise RuntimeError(f"Socket directory {socket_dir} must be a 0700 directory owned by the current user")
+    return socket_dir
+
+
+def _authkey_path(socket_path: str) -> str:
+    """Path of the authkey file written next to the socket"""
+    return os.path.join(os.path.dirname(os.path.abspath(socket_path)), AUTHKEY_FILENAME)
+
+
+def _server_authkey(socket_path: str) -> bytes:
+    """
+    Shared secret for the socket handshake
+
+    Uses WORKER_AUTHKEY when set; otherwise generates a random key and writes
+    it to a 0600 file next to the socket for local clients to read.
+    """
+    key = os.getenv('WORKER_AUTHKEY')
+    if key:
+        return key.encode()
+
+    key = secrets.token_hex(32).encode()
+    fd = os.open(_authkey_path(socket_path), os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'wb') as f:
+        f.write(key)
+    return key
+
+
+def _client_authkey(socket_path: str) -> bytes:
+    """
+    Shared secret for the socket handshake (WORKER_AUTHKEY or the worker's authkey file)
+
+    Raises:
+        RuntimeError: If neither is available
+    """
+    key = os.getenv('WORKER_AUTHKEY')
+    if key:
+        return key.encode()
+    try:
+        with open(_authkey_path(socket_path), 'rb') as f:
+            return f.read().strip()
+    except OSError as e:
+        raise RuntimeError(f"No worker authkey: set WORKER_AUTHKEY or start the worker first ({e})")
+
+
+def _validate_request(request, output_prefix: str) -> dict:
+    """
+    Check a request before it reaches edit_image
+
+    Only REQUEST_KEYS are accepted, and output_path must resolve inside the
+    output directory (output_prefix: resolved directory plus a trailing separator).
+
+    Returns:
+        The request with output_path resolved
+
+    Raises:
+        ValueError: If the request is malformed or writes outside the output directory
+    """
+    if not isinstance(request, dict):
+        raise ValueError("Request must be a dict")
+    unknown = set(request) - REQUEST_KEYS
+    if unknown:
+        raise ValueError(f"Unsupported request keys: {', '.join(sorted(map(str, unknown)))}")
+
+    image_paths = request.get('image_paths')
+    if not isinstance(image_paths, list) or not all(isinstance(p, str) for p in image_paths):
+        raise ValueError("image_paths must be a list of paths")
+    if not isinstance(request.get('prompt'), str):
+        raise ValueError("prompt must be a string")
+
+    output_path = request.get('output_path')
+    if not isinstance(output_path, str):
+        raise ValueError("output_path must be a string")
+    output_path = os.path.realpath(output_path)
+    if not output_path.startswith(output_prefix):
+        raise ValueError(f"output_path must be inside {output_prefix}")
+
+    return {**request, 'output_path': output_path}
+
+
+def serve(
+    socket_path: str = DEFAULT_SOCKET_PATH,
+    quantization_level: str = "Q4_K_M",
+    use_gguf: bool = True,
+    output_dir: str = DEFAULT_OUTPUT_DIR
+):
+    """
+    Load the model once and handle edit requests until interrupted
+
+    Each request is a dict of ImageEditor.edit_image keyword arguments
+    (limited to REQUEST_KEYS); each reply is {'output_path': str} or {'error': str}.
+
+    Args:
+        socket_path: Unix socket to listen on
+        quantization_level: GGUF quantization level
+        use_gguf: Whether to use the GGUF quantized model
+        output_dir: Directory that every output_path must resolve inside
+    """
+    from image_editor import ImageEditor
+
+    _private_dir(socket_path)
+    authkey = _server_authkey(socket_path)
+    output_prefix = os.path.join(os.path.realpath(output_dir), '')
+
+    logger.info(f"Loading model (GGUF={use_gguf}, {quantization_level})...")
+    editor = ImageEditor.get_or_create(use_gguf=use_gguf, quantization_level=quantization_level)
+    logger.info(f"Model ready: {editor.get_model_info()}")
+
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+
+    # Requests are pickled; create the socket 0600 from the start
+    old_umask = os.umask(0o077)
+    try:
+        listener = Listener(socket_path, family='AF_UNIX', authkey=authkey)
+    finally:
+        os.umask(old_umask)
+
+    with listener:
+        logger.info(f"Worker listening on {socket_path}")
+
+        while True:
+            try:
+                conn = listener.accept()
+            except KeyboardInterrupt:
+                break
+            except Exception as e:
+                logger.error(f"Error accepting connection: {str(e)}")
+                continue
+
+            with conn:
+                try:
+                    request = _validate_request(conn.recv(), output_prefix)
+                    output_path = editor.edit_image(**request)
+                    conn.send({'output_path': output_path})
+                except Exception as e:
+                    logger.error(f"Error handling request: {str(e)}")
+                    try:
+                        conn.send({'error': str(e)})
+                    except Exception:
+                        pass
+
+    logger.info("Worker stopped")
+
+
+def submit_edit(
+    image_paths: List[str],
+    prompt: str,
+    output_path: str,
+    negative_prompt: Optional[str] = None,
+    true_cfg_scale: float = 4.0,
+    num_inference_steps: int = 25,
+    socket_path: str = DEFAULT_SOCKET_PATH
+) -> str:
+    """
+    Send an edit request to a running worker and wait for the result
+
+    Returns:
+        Path to the edited image
+
+    Raises:
+        Exception: If the worker reports an error
+    """
+    with Client(socket_path, family='AF_UNIX', authkey=_client_authkey(socket_path)) as conn:
+        conn.send({
+            'image_paths': image_paths,
+            'prompt': prompt,
+            'negative_prompt': negative_prompt,
+            'true_cfg_scale': true_cfg_scale,
+            'num_inference_steps': num_inference_steps,
+            'output_path': output_path
+        })
+        reply = conn.recv()
+
+    if 'error' in reply:
+        raise Exception(reply['error'])
+    return reply['output_path']
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Resident Qwen-Image-Edit worker")
+
+    parser.add_argument('--socket', type=str, default=DEFAULT_SOCKET_PATH, help="Unix socket path")
+    parser.add_argument('--quantization', type=str, default="Q4_K_M", help="GGUF quantization level")
+    parser.add_argument('--standard', action='store_true', help="Use the standard (non-GGUF) model")
+    parser.add_argument('--output-dir', type=str, default=DEFAULT_OUTPUT_DIR, help="Directory outputs must be written inside")
+
+    args = parser.parse_args()
+
+    try:
+        serve(
+            args.socket,
+            quantization_level=args.quantization,
+            use_gguf=not args.standard,
+            output_dir=args.output_dir
+        )
+    except KeyboardInterrupt:
+        sys.exit(0)
+
+
+if __name__ == '__main__':
+    main()
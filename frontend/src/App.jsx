@@ -13,8 +13,8 @@ function App() {
     prompt: '',
     negative_prompt: '',
     true_cfg_scale: 4.0,
-    num_inference_steps: 50,
-    quantization_level: 'Q5_K_S'
+    num_inference_steps: 25,
+    quantization_level: 'Q4_K_M'
   })
   const [jobId, setJobId] = useState(null)
   const [isProcessing, setIsProcessing] = useState(false)
@@ -106,8 +106,8 @@ function App() {
       prompt: '',
       negative_prompt: '',
       true_cfg_scale: 4.0,
-      num_inference_steps: 50,
-      quantization_level: 'Q5_K_S'
+      num_inference_steps: 25,
+      quantization_level: 'Q4_K_M'
     })
     localStorage.removeItem('qwen_editor_current_job')
   }
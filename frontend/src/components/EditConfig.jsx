@@ -115,7 +115,7 @@ export default function EditConfig({ images, config, onChange, onGenerate, onBac
       updates.max_images = config.max_images || 1
     } else if (modelType === 'qwen_gguf') {
       // Set GGUF defaults
-      updates.quantization_level = config.quantization_level || 'Q5_K_S'
+      updates.quantization_level = config.quantization_level || 'Q4_K_M'
     }
 
     onChange(updates)
@@ -486,7 +486,7 @@ export default function EditConfig({ images, config, onChange, onGenerate, onBac
                 {config.model_type === 'qwen_gguf' ? (
                   <>
                     <p className="font-medium text-gray-800">Local image editing - preserves input dimensions</p>
-                    <p className="text-xs text-gray-600 mt-1">1-2 input images • 1 output • Matches input size • {config.num_inference_steps} steps • {config.quantization_level || 'Q5_K_S'}</p>
+                    <p className="text-xs text-gray-600 mt-1">1-2 input images • 1 output • Matches input size • {config.num_inference_steps} steps • {config.quantization_level || 'Q4_K_M'}</p>
                   </>
                 ) : config.model_type === 'hunyuan' ? (
                   <>
@@ -526,17 +526,18 @@ export default function EditConfig({ images, config, onChange, onGenerate, onBac
               Quantization Level
             </label>
             <select
-              value={config.quantization_level || 'Q5_K_S'}
+              value={config.quantization_level || 'Q4_K_M'}
               onChange={handleQuantizationLevelChange}
               className="w-full px-4 py-3 border border-gray-300 rounded-lg focus:ring-2 focus:ring-purple-500 focus:border-transparent"
             >
               <option value="Q2_K">Q2_K - Lowest quality, fastest, ~7GB VRAM</option>
-              <option value="Q4_K_M">Q4_K_M - Good quality, fast, ~14GB VRAM</option>
-              <option value="Q5_K_S">Q5_K_S - Best balance (Recommended), ~17GB VRAM</option>
+              <option value="Q4_K_M">Q4_K_M - Best balance (Recommended), ~14GB VRAM</option>
+              <option value="Q5_K_S">Q5_K_S - Better quality, ~17GB VRAM</option>
+              <option value="Q6_K">Q6_K - Near-Q8 quality, ~19GB VRAM</option>
               <option value="Q8_0">Q8_0 - Highest quality, slower, ~22GB VRAM</option>
             </select>
             <p className="mt-1 text-sm text-gray-500">
-              Higher quantization = better quality but more VRAM and slower processing. Q5_K_S is recommended for most users.
+              Higher quantization = better quality but more VRAM and slower processing. Q4_K_M is recommended for most users.
             </p>
           </div>
         )}